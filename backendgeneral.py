@@ -1,6 +1,10 @@
 import sys
 import os
-import spectral
+import sqlite3
+import bisect
+import hashlib
+import math
+import time
 import numpy as np
 from PyQt5 import QtWidgets, QtGui, QtCore
 from PyQt5.QtWidgets import QFileDialog, QListWidgetItem, QGraphicsScene, QGraphicsPixmapItem, QGraphicsRectItem, QLabel, QFrame, QGraphicsTextItem, QDialog, QVBoxLayout, QTextEdit, QPushButton
@@ -16,6 +20,13 @@ from info_ui import InfoDialog
 from function_info_ui import FunctionInfoDialog
 from PyQt5.QtWidgets import QApplication
 from welcome import WelcomeDialog
+from cube_io import TEMP_DATA_MAX_BYTES, H5Cube, MaskedCube, h5_cache_path, is_memmapped, prune_cache_dir, read_band
+from sample_index import SampleIndex
+from band_tiles import BandPanel, TileLayer, uint8_pixmap
+from cube_stats import histogram_percentile
+from stretch import STRETCH_MODES, Stretch, apply_colormap, colormap_lut, image_histogram, stretch_image
+from workers import BandPrefetcher, CubeLoader, DisplayCubeBuilder, FolderLister, ObjectStatsWorker, SpectrumWorker, ThumbnailLoader, StatsWorker, WorkingCacheWriter
+from band_view import COMPOSITE_PRESETS, DISPLAY_CUBE_MAX_BYTES, MAX_LEVEL, MAX_WINDOW_FRACTION, RATIO_COLORMAPS, RATIO_DEFAULT_WAVELENGTHS, RATIO_MODES, WINDOW_MARGIN, BandImageCache, BandRatio, RGBComposite, align_window, band_wavelengths, crop_window, parse_band_list, preset_bands, ratio_display_range, BandPyramid, choose_level, prefetch_order, render_band, window_contains
 
 class BoundingBox(QGraphicsRectItem): 
     """A resizable and movable bounding box for object selection."""
@@ -66,6 +77,19 @@ class UI_Checker(QtWidgets.QDialog, Ui_Dialog):
         # Create temporary directory for application data
         self.temp_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "temp_data")
         os.makedirs(self.temp_dir, exist_ok=True)
+
+        # Persistent index of capture folders, kept next to the application
+        index_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "sample_index.sqlite")
+        try:
+            self.sample_index = SampleIndex(index_path)
+        except sqlite3.Error:
+            # Read-only install; index for this session only
+            self.sample_index = SampleIndex(":memory:")
+
+        # On-disk cache of capture folder thumbnails, keyed by source path and mtime
+        self.thumbnail_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "thumbnail_cache")
+        os.makedirs(self.thumbnail_dir, exist_ok=True)
+        self.thumbnail_loader = None
         
         # Connect close event
         self.closeEvent = self.on_close
@@ -119,9 +143,29 @@ class UI_Checker(QtWidgets.QDialog, Ui_Dialog):
         
         # Connect slider to update band display
         self.horizontalSlider.valueChanged.connect(self.on_slider_value_changed)
+        self.horizontalSlider.sliderReleased.connect(self.refresh_band_level)
         
         # Connect doubleSpinBox to update band display
         self.doubleSpinBox.valueChanged.connect(self.on_spinbox_value_changed)
+
+        # Play/pause band playback beside the slider; right-click sets range and speed
+        self.horizontalSlider.setGeometry(QtCore.QRect(380, 580, 136, 21))
+        self.playButton = QtWidgets.QPushButton(self)
+        self.playButton.setGeometry(QtCore.QRect(522, 574, 34, 33))
+        self.playButton.setText("\u25B6")
+        self.playButton.setToolTip("Play through the bands (right-click for range and speed)")
+        self.playButton.clicked.connect(self.toggle_playback)
+        self.playButton.setContextMenuPolicy(Qt.CustomContextMenu)
+        self.playButton.customContextMenuRequested.connect(self.show_playback_dialog)
+        self.playback_fps = 30.0
+        self.playback_range = None  # (first, last) band; None plays every band
+        self.playback_timer = QTimer(self)
+        self.playback_timer.setTimerType(Qt.PreciseTimer)
+        self.playback_timer.timeout.connect(self.playback_tick)
+        self._playback_clock = None
+        self._playback_frames = 0
+        self._playback_dropped = 0
+        self._playback_report = None
         
         # Configure doubleSpinBox for integer values
         self.doubleSpinBox.setDecimals(0)  # No decimal places
@@ -249,7 +293,20 @@ class UI_Checker(QtWidgets.QDialog, Ui_Dialog):
         self.pushButton_7.clicked.connect(self.clear_all_data)
 
         # Add tooltip to RGB Display button
-        self.pushButton.setToolTip("Tap and Hold")
+        self.pushButton.setToolTip("Tap and Hold (right-click for a false-colour composite)")
+
+        # Right-click RGB DISPLAY to build a composite from any three bands
+        self.pushButton.setContextMenuPolicy(Qt.CustomContextMenu)
+        self.pushButton.customContextMenuRequested.connect(self.show_composite_dialog)
+        self.composite = None  # RGBComposite on screen while the composite dialog is open
+        self.band_ratio = None  # BandRatio on screen while the band ratio dialog is open
+
+        # Band panels of the compare dialog; pan and zoom are shared by all of them
+        self.compare_panels = []
+        self.compare_zoom = 1.0
+        self._compare_center = None  # Scene point at the centre of every panel
+        self._compare_syncing = False
+        self._compare_refresh_scheduled = False
         self.pushButton.setStyleSheet("""
             QPushButton {
                 font-size: 12px;
@@ -276,6 +333,46 @@ class UI_Checker(QtWidgets.QDialog, Ui_Dialog):
         self.graphicsView.mousePressEvent = self.start_drawing
         self.graphicsView.mouseMoveEvent = self.update_drawing
         self.graphicsView.mouseReleaseEvent = self.finish_drawing
+        self.graphicsView.wheelEvent = self.on_view_wheel
+
+        # Right-click the band view to choose the contrast stretch
+        self.graphicsView.setContextMenuPolicy(Qt.CustomContextMenu)
+        self.graphicsView.customContextMenuRequested.connect(self.show_stretch_menu)
+
+        # Band view zoom relative to fit-in-view, and the pyramid level on screen
+        self.view_zoom = 1.0
+        self.max_view_zoom = 32.0
+        self._shown_level = None
+
+        # Band levels are shown as tiles. When zoomed in only the tiles around the
+        # visible area are rendered; panning with the scroll bars adds the new ones
+        self.tile_layer = TileLayer(self.scene)
+        self._shown_window = None  # (x0, y0, x1, y1) display window on screen, None for the whole band
+        self._view_refresh_scheduled = False
+        self.graphicsView.horizontalScrollBar().valueChanged.connect(self.request_view_refresh)
+        self.graphicsView.verticalScrollBar().valueChanged.connect(self.request_view_refresh)
+
+        # One pixmap item is reused for every band frame; the buffer holds frames built here
+        self.band_item = None
+        self._frame_buffer = None
+
+        # Render the bands next to the slider position once it stops moving
+        self.band_prefetcher = None
+        self._scroll_direction = 0
+        self.prefetch_timer = QTimer(self)
+        self.prefetch_timer.setSingleShot(True)
+        self.prefetch_timer.setInterval(150)
+        self.prefetch_timer.timeout.connect(self.start_band_prefetch)
+
+        # Slider and spinbox changes are coalesced; only the latest band is drawn
+        self._render_scheduled = False
+        self.frame_time_ms = None  # Smoothed time to draw a band at the level for the view
+        self.last_frame_ms = None
+        self.frame_budget_ms = 40.0  # Drags draw coarser levels when frames take longer
+        self.refine_timer = QTimer(self)
+        self.refine_timer.setSingleShot(True)
+        self.refine_timer.setInterval(150)
+        self.refine_timer.timeout.connect(self.refresh_band_level)
 
         # Add storage for bounding box coordinates
         self.stored_box_coords = None
@@ -283,6 +380,11 @@ class UI_Checker(QtWidgets.QDialog, Ui_Dialog):
         # Add storage for current mask
         self.current_mask = None
 
+        # Segmented objects as a label image in data orientation (0 = background,
+        # i + 1 = bounding box i) and the number of boxes it was made from
+        self.object_labels = None
+        self.object_count = 0
+
         # Initialize SAM model
         self.sam_predictor = None
 
@@ -392,13 +494,33 @@ class UI_Checker(QtWidgets.QDialog, Ui_Dialog):
         self.pushButton_7.setStyleSheet(button_style)
 
         self.current_folder = ""  
+        self.folder_lister = None  # Background listing of the folder being shown
+        self._folder_listings = {}  # folder -> (folder mtime_ns, [(name, mtime)])
+        self._listed_folder = None  # Folder whose subfolders listWidget shows
+        self._listing_keys = []  # Negated mtimes of the listed items, in list order
+        self._folder_items = {}  # Subfolder name -> its listWidget item
         self.image_path = None  
         self.hdr_path = None  
         self.hdr_data = None  
+        self.hdr_image = None  # spectral image object backing hdr_data
+        self.cube_load_mode = "auto"  # "auto", "memmap" or "load"
+        self.bip_band_cache = True  # Build a band-major copy of memory-mapped BIP cubes
+        self.use_working_cache = True  # Open a capture's HDF5 working cache when present
+        self.cube_loader = None  # Loader for the folder currently selected
+        self.stats_worker = None  # Statistics pass for the current cube
+        self.cube_stats = None  # Per-band statistics of the current cube
+        self.spectrum_worker = None  # Full-image spectrum pass when the statistics pass failed
+        self.stretch = Stretch()  # Contrast stretch of the band view
+        self.build_display_cube = True  # Quantize cubes that fit into uint8 display frames
+        self.display_cube = None  # (bands, height, width) uint8 frames of the current cube
+        self.display_cube_builder = None
+        self._background_threads = set()  # All worker threads that are still running
         self.current_band = 0  
-        self._band_cache = {}  # Cache for processed band images
-        self._max_cache_size = 10  # Maximum number of bands to cache
+        self._band_cache = BandImageCache()  # Rendered band levels, LRU bounded by memory
+        self._segmented_band_cache = BandImageCache()  # Rendered bands of the segmented view
         self._spectral_cache = {}  # Cache for spectral signatures
+        self._pending_spectrum_action = None  # Plot or export waiting for spectra being computed
+        self.object_stats_worker = None  # Statistics pass over the segmented objects
         self._last_mask_hash = None  # Hash of last mask for cache invalidation
         # Add a variable to track the last display state
         self.last_display_state = "hdr"  # Options: "hdr", "segmentation"
@@ -408,6 +530,14 @@ class UI_Checker(QtWidgets.QDialog, Ui_Dialog):
         self.current_spectral_data = None
         self.cursor_annotation = None
         self.cursor_vline = None
+        self._plot_background = None  # Plot without the cursor, for blitting the cursor
+        self._pending_hover = None  # Latest hover event waiting for the next refresh
+        # Hover events are drawn at most once per display refresh
+        refresh_rate = QApplication.primaryScreen().refreshRate() if QApplication.primaryScreen() else 0
+        self.hover_timer = QTimer(self)
+        self.hover_timer.setSingleShot(True)
+        self.hover_timer.setInterval(int(1000 / refresh_rate) if refresh_rate > 0 else 16)
+        self.hover_timer.timeout.connect(self.on_hover_timer)
 
         # Remove the question mark from the title bar
         self.setWindowFlags(self.windowFlags() & ~Qt.WindowContextHelpButtonHint)
@@ -468,10 +598,17 @@ class UI_Checker(QtWidgets.QDialog, Ui_Dialog):
             }
         """)
 
+        # Room for capture thumbnails in the folder list
+        self.listWidget.setIconSize(QtCore.QSize(40, 40))
+
         # Configure listWidget (folder navigation) scrollbar
         self.listWidget.setVerticalScrollBarPolicy(Qt.ScrollBarAlwaysOn)
         self.listWidget.setHorizontalScrollBarPolicy(Qt.ScrollBarAlwaysOff)
 
+        # Right-click a folder for actions such as converting it to a working cache
+        self.listWidget.setContextMenuPolicy(Qt.CustomContextMenu)
+        self.listWidget.customContextMenuRequested.connect(self.show_folder_context_menu)
+
         self.listWidget.setStyleSheet("""
             QListWidget {
                 background-color: white;
@@ -686,31 +823,39 @@ class UI_Checker(QtWidgets.QDialog, Ui_Dialog):
         # Store all spectral signatures for statistics
         all_signatures = []
 
-        # Calculate global min/max values from full image
-        full_signature = np.mean(self.hdr_data, axis=(0, 1))
-        global_min = np.min(full_signature)
-        global_max = np.max(full_signature)
+        # Global min/max values of the full image spectrum
+        full_spectrum = self.full_image_spectrum()
+        if full_spectrum is None:
+            self.run_when_spectra_ready(self.plot_spectral_signature, "full-image spectrum")
+            return
+        _, global_min, global_max = full_spectrum
+
+        # Spread of the segmented objects, for the +/-1 std envelopes
+        object_stats = self.object_statistics()
+        if object_stats is None and self.objects_segmented():
+            self.run_when_spectra_ready(self.plot_spectral_signature, "object statistics")
+            return
+        plotted = []  # (index, box_data, signature, std) of each plotted object
 
-        # Plot spectral signature for each bounding box
-        for box_data in self.bounding_boxes:
+        # Plot spectral signature for each segmented object
+        for index, box_data in enumerate(self.bounding_boxes):
             if hasattr(self, 'segmented_hdr_data') and self.segmented_hdr_data is not None:
-                # Get the box coordinates
-                x1 = int(box_data['x'])
-                y1 = int(box_data['y'])
-                x2 = int(x1 + box_data['width'])
-                y2 = int(y1 + box_data['height'])
+                # Average spectral signature over the object's mask
+                avg_spectral_signature = self.object_spectrum(index, box_data)
 
-                # Get the data for this region
-                region_data = self.hdr_data[y1:y2, x1:x2, :]
-                
-                if region_data.size > 0:
-                    # Calculate average spectral signature for this region
-                    avg_spectral_signature = np.mean(region_data, axis=(0, 1))
+                if avg_spectral_signature is not None:
                     all_signatures.append(avg_spectral_signature)
+                    if object_stats is not None and index < self.object_count:
+                        std = object_stats["std"][index]
+                    else:
+                        std = None
+                    plotted.append((index, box_data, avg_spectral_signature, std))
 
-                    # Update global min/max if needed
-                    global_min = min(global_min, np.min(avg_spectral_signature))
-                    global_max = max(global_max, np.max(avg_spectral_signature))
+                    # Update global min/max if needed, keeping the envelope in view
+                    low = avg_spectral_signature - std if std is not None else avg_spectral_signature
+                    high = avg_spectral_signature + std if std is not None else avg_spectral_signature
+                    global_min = min(global_min, np.nanmin(low))
+                    global_max = max(global_max, np.nanmax(high))
 
                     # Convert QColor to RGB values for matplotlib
                     color = box_data['color']
@@ -719,6 +864,9 @@ class UI_Checker(QtWidgets.QDialog, Ui_Dialog):
                     # Plot with matching color and label
                     line, = ax.plot(avg_spectral_signature, color=rgb_color, 
                                   label=f"{box_data['label']}", linewidth=2)
+                    if std is not None:
+                        ax.fill_between(np.arange(len(avg_spectral_signature)), low, high,
+                                        color=rgb_color, alpha=0.2, linewidth=0)
 
         if not all_signatures:
             self.log_message("No valid data in the segmented regions", "error")
@@ -787,10 +935,16 @@ class UI_Checker(QtWidgets.QDialog, Ui_Dialog):
         # Add vertical line for cursor tracking
         self.cursor_vline = ax.axvline(x=0, color='gray', alpha=0.5, linestyle='--', visible=False)
 
+        # The cursor is blitted over the cached plot instead of redrawing the figure
+        self.cursor_annotation.set_animated(True)
+        self.cursor_vline.set_animated(True)
+        self._plot_background = None
+
         # Adjust layout to prevent cutting off labels
         figure.tight_layout()
 
         # Connect events for mouse movement and clicking
+        canvas.mpl_connect('draw_event', self.on_plot_draw)
         self.canvas_mpl_connect_id = canvas.mpl_connect('motion_notify_event', self.on_plot_hover)
         self.canvas_mpl_click_id = canvas.mpl_connect('button_press_event', self.on_plot_click)
 
@@ -804,11 +958,14 @@ class UI_Checker(QtWidgets.QDialog, Ui_Dialog):
         self.figure = figure
 
         # Log statistics for each object
-        for i, (box_data, signature) in enumerate(zip(self.bounding_boxes, all_signatures)):
+        for index, box_data, signature, std in plotted:
             self.log_message(f"\nStatistics for {box_data['label']}:", "info")
-            self.log_message(f"Min intensity: {np.min(signature):.2f}")
-            self.log_message(f"Max intensity: {np.max(signature):.2f}")
-            self.log_message(f"Mean intensity: {np.mean(signature):.2f}")
+            self.log_message(f"Min intensity: {np.nanmin(signature):.2f}")
+            self.log_message(f"Max intensity: {np.nanmax(signature):.2f}")
+            self.log_message(f"Mean intensity: {np.nanmean(signature):.2f}")
+            if std is not None:
+                self.log_message(f"Pixels: {int(object_stats['count'][index].max())}")
+                self.log_message(f"Mean std: {np.nanmean(std):.2f}")
 
     def plot_full_spectral_signature(self):
         """Plot the spectral signature for the entire image."""
@@ -821,14 +978,18 @@ class UI_Checker(QtWidgets.QDialog, Ui_Dialog):
             self.graphicsView_2.setScene(QGraphicsScene())
         self.graphicsView_2.scene().clear()
 
+        # Average spectral signature for the entire image
+        full_spectrum = self.full_image_spectrum()
+        if full_spectrum is None:
+            self.run_when_spectra_ready(self.plot_full_spectral_signature, "full-image spectrum")
+            return
+        full_signature, y_min, y_max = full_spectrum
+
         # Create a new matplotlib figure
         figure = Figure(figsize=(5, 4))
         canvas = FigureCanvas(figure)
         ax = figure.add_subplot(111)
 
-        # Calculate average spectral signature for the entire image
-        full_signature = np.mean(self.hdr_data, axis=(0, 1))
-
         # Plot the spectral signature
         ax.plot(full_signature, color='blue', linewidth=2, label='Full Image')
 
@@ -848,7 +1009,6 @@ class UI_Checker(QtWidgets.QDialog, Ui_Dialog):
         ax.set_xlim(0, num_bands - 1)
 
         # Set y-axis limits with padding
-        y_min, y_max = np.min(full_signature), np.max(full_signature)
         y_range = y_max - y_min
         y_padding = y_range * 0.1
         ax.set_ylim(y_min - y_padding, y_max + y_padding)
@@ -891,10 +1051,16 @@ class UI_Checker(QtWidgets.QDialog, Ui_Dialog):
         # Add vertical line for cursor tracking
         self.cursor_vline = ax.axvline(x=0, color='gray', alpha=0.5, linestyle='--', visible=False)
 
+        # The cursor is blitted over the cached plot instead of redrawing the figure
+        self.cursor_annotation.set_animated(True)
+        self.cursor_vline.set_animated(True)
+        self._plot_background = None
+
         # Adjust layout to prevent cutting off labels
         figure.tight_layout()
 
         # Connect events for mouse movement and clicking
+        canvas.mpl_connect('draw_event', self.on_plot_draw)
         self.canvas_mpl_connect_id = canvas.mpl_connect('motion_notify_event', self.on_plot_hover)
         self.canvas_mpl_click_id = canvas.mpl_connect('button_press_event', self.on_plot_click)
 
@@ -914,9 +1080,46 @@ class UI_Checker(QtWidgets.QDialog, Ui_Dialog):
         self.log_message(f"Mean intensity: {np.mean(full_signature):.2f}")
 
     def on_plot_hover(self, event):
-        """Handle mouse movement over the spectral plot."""
+        """Handle mouse movement over the spectral plot, at most once per display refresh."""
+        if self.hover_timer.isActive():
+            self._pending_hover = event  # Drawn when the timer fires
+            return
+        self.update_plot_cursor(event)
+        self.hover_timer.start()
+
+    def on_hover_timer(self):
+        """Draw the latest hover event that arrived during the last refresh interval."""
+        event, self._pending_hover = self._pending_hover, None
+        if event is not None:
+            self.update_plot_cursor(event)
+            self.hover_timer.start()
+
+    def on_plot_draw(self, event):
+        """Cache the freshly drawn plot as the cursor background and draw the cursor on it."""
+        if event.canvas is not self.canvas:
+            return
+        self._plot_background = self.canvas.copy_from_bbox(self.figure.bbox)
+        for artist in (self.cursor_vline, self.cursor_annotation):
+            if artist is not None and artist.get_visible():
+                self.figure.draw_artist(artist)
+
+    def blit_plot_cursor(self):
+        """Redraw only the cursor line and annotation over the cached plot background."""
+        if self._plot_background is None:
+            self.canvas.draw_idle()  # on_plot_draw caches the background
+            return
+        self.canvas.restore_region(self._plot_background)
+        for artist in (self.cursor_vline, self.cursor_annotation):
+            if artist is not None and artist.get_visible():
+                self.figure.draw_artist(artist)
+        self.canvas.blit(self.figure.bbox)
+
+    def update_plot_cursor(self, event):
+        """Move the cursor line and annotation of the spectral plot to a mouse event."""
         if not hasattr(self, 'statusBar') or not hasattr(self, 'current_spectral_data'):
             return
+        if not getattr(self, 'canvas', None) or event.canvas is not self.canvas:
+            return  # Event from a plot that has since been replaced
             
         if event.inaxes:
             # Get x and y coordinates
@@ -1012,17 +1215,15 @@ class UI_Checker(QtWidgets.QDialog, Ui_Dialog):
                     self.cursor_annotation.set_visible(False)
                 self.statusBar.clearMessage()
             
-            # Redraw canvas
-            if hasattr(self, 'canvas') and self.canvas:
-                self.canvas.draw_idle()
+            # Redraw the cursor
+            self.blit_plot_cursor()
         else:
             # Hide annotation and line when cursor leaves plot
             if hasattr(self, 'cursor_annotation') and self.cursor_annotation:
                 self.cursor_annotation.set_visible(False)
             if hasattr(self, 'cursor_vline') and self.cursor_vline:
                 self.cursor_vline.set_visible(False)
-            if hasattr(self, 'canvas') and self.canvas:
-                self.canvas.draw_idle()
+            self.blit_plot_cursor()
             self.statusBar.clearMessage()
 
     def on_plot_click(self, event):
@@ -1139,28 +1340,116 @@ class UI_Checker(QtWidgets.QDialog, Ui_Dialog):
                 self.display_folder_contents(parent_folder)
 
     def display_folder_contents(self, folder_path):
-        """Displays the list of subfolders sorted by date (latest first)."""
-        self.listWidget.clear()
+        """Displays the list of subfolders sorted by date (latest first).
+
+        Listings are cached per folder and reused while the folder's mtime is
+        unchanged; otherwise the folder is scanned in a FolderLister thread
+        and its entries are inserted in date order as batches arrive.
+        """
         folder_path = os.path.normpath(folder_path)  
 
         if not os.path.exists(folder_path):
+            self.cancel_folder_listing()
+            self.listWidget.clear()
+            self._listed_folder = None
             self.log_message(f"Error: The folder '{folder_path}' does not exist.", "error")
             return
 
-        folders = [
-            (item, os.path.getmtime(os.path.join(folder_path, item))) 
-            for item in os.listdir(folder_path) 
-            if os.path.isdir(os.path.join(folder_path, item))
-        ]
+        if self.folder_lister is not None and self.folder_lister.folder == folder_path:
+            return  # Already being listed
 
-        folders.sort(key=lambda x: x[1], reverse=True)  
+        try:
+            folder_mtime = os.stat(folder_path).st_mtime_ns
+        except OSError:
+            folder_mtime = None
+        cached = self._folder_listings.get(folder_path)
+        if cached is not None and cached[0] == folder_mtime:
+            if self._listed_folder != folder_path:
+                self.cancel_folder_listing()
+                self.start_folder_list(folder_path)
+                self.add_folder_items(cached[1])
+                self.start_thumbnail_loader(folder_path, cached[1])
+                QtCore.QTimer.singleShot(100, self.listWidget.scrollToTop)
+            return
 
-        for folder_name, _ in folders:
-            list_item = QListWidgetItem(self.folder_icon, folder_name)
-            self.listWidget.addItem(list_item)
-        
+        self.cancel_folder_listing()
+        self.start_folder_list(folder_path)
+        lister = FolderLister(folder_path, parent=self)
+        lister.batch_ready.connect(self.on_folder_batch)
+        lister.listed.connect(self.on_folder_listed)
+        lister.failed.connect(self.on_folder_list_failed)
+        self.folder_lister = lister
+        self.start_worker(lister)
+
+    def start_folder_list(self, folder_path):
+        """Empty listWidget before it is filled with folder_path's subfolders."""
+        self.cancel_thumbnail_loader()
+        self.listWidget.clear()
+        self._listed_folder = folder_path
+        self._listing_keys = []
+        self._folder_items = {}
+
+    def add_folder_items(self, entries):
+        """Insert (name, mtime) entries into listWidget, keeping latest first."""
+        for folder_name, mtime in entries:
+            # bisect_right keeps equal mtimes in scan order, like the stable sort it replaces
+            row = bisect.bisect_right(self._listing_keys, -mtime)
+            self._listing_keys.insert(row, -mtime)
+            item = QListWidgetItem(self.folder_icon, folder_name)
+            self._folder_items[folder_name] = item
+            self.listWidget.insertItem(row, item)
+
+    def cancel_folder_listing(self):
+        """Stop a folder listing that is still running."""
+        if self.folder_lister is not None:
+            self.folder_lister.cancel()
+            self.folder_lister = None
+
+    def on_folder_batch(self, entries):
+        """Show a batch of subfolders from the running listing."""
+        if self.sender() is not self.folder_lister:
+            return  # Listing of a folder that is no longer shown
+        self.add_folder_items(entries)
+
+    def on_folder_listed(self, folder_path, folder_mtime, entries):
+        """Cache a finished listing for later visits."""
+        if self.sender() is not self.folder_lister:
+            return
+        self.folder_lister = None
+        self._folder_listings[folder_path] = (folder_mtime, entries)
+        self.start_thumbnail_loader(folder_path, entries)
         QtCore.QTimer.singleShot(100, self.listWidget.scrollToTop)
 
+    def start_thumbnail_loader(self, folder_path, entries):
+        """Fetch thumbnails for listed subfolders, latest first."""
+        self.cancel_thumbnail_loader()
+        names = sorted(entries, key=lambda entry: entry[1], reverse=True)
+        folders = [os.path.join(folder_path, name) for name, _ in names]
+        loader = ThumbnailLoader(folders, self.thumbnail_dir, self.sample_index.path, parent=self)
+        loader.thumbnail_ready.connect(self.on_thumbnail_ready)
+        self.thumbnail_loader = loader
+        self.start_worker(loader)
+
+    def cancel_thumbnail_loader(self):
+        if self.thumbnail_loader is not None:
+            self.thumbnail_loader.cancel()
+            self.thumbnail_loader = None
+
+    def on_thumbnail_ready(self, folder, thumbnail):
+        """Replace a subfolder's generic icon with its thumbnail."""
+        if self.sender() is not self.thumbnail_loader:
+            return
+        item = self._folder_items.get(os.path.basename(folder))
+        if item is not None:
+            item.setIcon(QtGui.QIcon(thumbnail))
+
+    def on_folder_list_failed(self, message):
+        if self.sender() is not self.folder_lister:
+            return
+        self.folder_lister = None
+        self._listed_folder = None
+        self.log_message(f"Error listing folder: {message}", "error")
+
     def on_folder_click(self, item):
         """Handles clicking on a folder and processes it."""
         selected_folder = os.path.join(self.current_folder, item.text())
@@ -1189,12 +1478,13 @@ class UI_Checker(QtWidgets.QDialog, Ui_Dialog):
         self.hdr_path = None  
         self.hdr_data = None  
 
-        # Search for PNG files in the selected folder and subfolders
-        png_files = []
-        for root, _, files in os.walk(folder_path):
-            for file in files:
-                if file.lower().endswith(".png"):
-                    png_files.append(os.path.join(root, file))
+        # One index lookup finds the PNG and HDR files in the folder and subfolders
+        try:
+            entry = self.sample_index.get(folder_path)
+        except (OSError, sqlite3.Error) as e:
+            self.log_message(f"Could not read folder {folder_name}: {e}", "error")
+            return
+        png_files = entry["png_files"]
         
         # If PNG files found, use the first one
         if png_files:
@@ -1202,20 +1492,7 @@ class UI_Checker(QtWidgets.QDialog, Ui_Dialog):
             if len(png_files) > 1:
                 self.log_message(f"Multiple PNG files found. Using: {os.path.basename(self.image_path)}", "info")
 
-        # Search for HDR files in the selected folder and subfolders
-        hdr_files = []
-        for root, _, files in os.walk(folder_path):
-            for file in files:
-                if file.lower().endswith(".hdr"):
-                    hdr_path = os.path.join(root, file)
-                    # Check for corresponding raw file
-                    base_name = os.path.splitext(hdr_path)[0]
-                    raw_exists = any(
-                        os.path.exists(base_name + ext) 
-                        for ext in ['.raw', '.RAW', '.bil', '.BIL', '.bsq', '.BSQ']
-                    )
-                    if raw_exists:
-                        hdr_files.append(hdr_path)
+        hdr_files = [hdr["path"] for hdr in entry["hdr_files"]]
 
         # If HDR files found, use the first one
         if hdr_files:
@@ -1230,10 +1507,58 @@ class UI_Checker(QtWidgets.QDialog, Ui_Dialog):
 
         self.update_ui()
 
+    def find_hdr_files(self, folder_path):
+        """Return HDR files under folder_path that have a corresponding raw file."""
+        return [hdr["path"] for hdr in self.sample_index.get(folder_path)["hdr_files"]]
+
+    def show_folder_context_menu(self, pos):
+        """Offer per-folder actions when a folder in listWidget is right-clicked."""
+        item = self.listWidget.itemAt(pos)
+        if item is None:
+            return
+        menu = QtWidgets.QMenu(self)
+        convert_action = menu.addAction("Convert to working cache")
+        chosen = menu.exec_(self.listWidget.viewport().mapToGlobal(pos))
+        if chosen == convert_action:
+            folder_path = os.path.normpath(os.path.join(self.current_folder, item.text()))
+            self.convert_folder_to_working_cache(folder_path)
+
+    def convert_folder_to_working_cache(self, folder_path):
+        """Write the HDF5 working cache for a capture folder in the background."""
+        try:
+            hdr_files = self.find_hdr_files(folder_path)
+        except (OSError, sqlite3.Error) as e:
+            self.log_message(f"Could not read folder {os.path.basename(folder_path)}: {e}", "error")
+            return
+        if not hdr_files:
+            self.log_message("No HDR files with corresponding raw data found", "warning")
+            return
+
+        hdr_path = hdr_files[0]
+        writer = WorkingCacheWriter(hdr_path, h5_cache_path(hdr_path), self)
+        name = os.path.basename(folder_path)
+        writer.progress.connect(
+            lambda percent: self.statusBar.showMessage(f"Writing working cache for {name} ({percent}%)"))
+        writer.done.connect(lambda path: self.on_working_cache_written(hdr_path, path))
+        writer.failed.connect(
+            lambda message: self.log_message(f"Error writing working cache: {message}", "error"))
+        self.log_message(f"Converting {name} to working cache...", "info")
+        self.start_worker(writer)
+
+    def on_working_cache_written(self, hdr_path, cache_path):
+        """Switch to the new working cache if its cube is the one on screen."""
+        self.statusBar.clearMessage()
+        self.log_message(f"Working cache written: {os.path.basename(cache_path)}", "success")
+        if self.hdr_path is not None and os.path.normpath(self.hdr_path) == os.path.normpath(hdr_path):
+            self.load_hdr_file()
+
     def clear_previous_data(self):
         """Clears all previously loaded data before loading a new folder."""
+        self.cancel_cube_load()
+        self.reset_view_zoom()
         self.scene.clear()  
         self.hdr_data = None
+        self.hdr_image = None
         self.image_path = None
         self.hdr_path = None
         self.current_band = 0
@@ -1258,17 +1583,346 @@ class UI_Checker(QtWidgets.QDialog, Ui_Dialog):
             self.show_png_image()  
 
     def load_hdr_file(self):
-        """Load and process HDR file with automatic band detection."""
+        """Start loading the HDR file in a background thread."""
+        self.cancel_cube_load()
+
+        self.prune_temp_dir()
+        band_cache_dir = self.temp_dir if self.bip_band_cache else None
+        loader = CubeLoader(self.hdr_path, self.cube_load_mode, band_cache_dir,
+                            self.use_working_cache, self)
+        loader.progress.connect(self.on_cube_load_progress)
+        loader.first_band_ready.connect(self.on_cube_first_band)
+        loader.loaded.connect(self.on_cube_loaded)
+        loader.failed.connect(self.on_cube_load_failed)
+        loader.band_cache_ready.connect(self.on_band_cache_ready)
+
+        self.cube_loader = loader
+        self.statusBar.showMessage(f"Loading {os.path.basename(self.hdr_path)}...")
+        self.start_worker(loader)
+
+    def cancel_cube_load(self):
+        """Cancel the in-flight cube load, if any, so a new one can start."""
+        self.stop_playback()
+        if self.cube_loader is not None:
+            self.cube_loader.cancel()
+            self.cube_loader = None
+            self.statusBar.clearMessage()
+        if self.stats_worker is not None:
+            self.stats_worker.cancel()
+            self.stats_worker = None
+        if self.spectrum_worker is not None:
+            self.spectrum_worker.cancel()
+            self.spectrum_worker = None
+        self.cube_stats = None
+        self._spectral_cache.clear()
+        self._pending_spectrum_action = None
+        self.cancel_object_stats()
+        self.invalidate_band_views()
+
+    def start_worker(self, worker):
+        """Start a worker thread and keep it alive until it finishes."""
+        self._background_threads.add(worker)
+        worker.finished.connect(lambda: self._on_worker_finished(worker))
+        worker.start()
+
+    def _on_worker_finished(self, worker):
+        """Release a worker thread once it has stopped running."""
+        self._background_threads.discard(worker)
+        worker.deleteLater()
+
+    def start_stats_pass(self):
+        """Load or compute the statistics of the current cube in the background."""
+        worker = StatsWorker(self.hdr_path, self.hdr_image.filename, self.hdr_data, self)
+        worker.progress.connect(self.on_stats_progress)
+        worker.ready.connect(self.on_stats_ready)
+        worker.failed.connect(self.on_stats_failed)
+        self.stats_worker = worker
+        self.start_worker(worker)
+
+    def on_stats_progress(self, percent):
+        """Report the statistics pass in the status bar."""
+        if self.sender() is not self.stats_worker:
+            return
+        self.statusBar.showMessage(f"Computing band statistics ({percent}%)")
+
+    def on_stats_ready(self, stats, from_sidecar):
+        """Install the statistics of the current cube."""
+        if self.sender() is not self.stats_worker:
+            return
+        self.cube_stats = stats
+        self.invalidate_band_views()
+        self.statusBar.clearMessage()
+        self.start_display_cube_build()
+        if from_sidecar:
+            self.log_message("Band statistics loaded from cache", "info")
+        else:
+            self.log_message("Band statistics computed", "info")
+        self.run_pending_spectrum_action()
+
+    def start_display_cube_build(self):
+        """Quantize the current cube into display frames in the background."""
+        if not self.build_display_cube or self.hdr_data is None or self.cube_stats is None:
+            return
+        if not self.stretch.is_global:
+            return  # Adaptive stretches depend on the whole frame; render on demand
+        rows, cols, bands = self.hdr_data.shape
+        if rows * cols * bands > DISPLAY_CUBE_MAX_BYTES:
+            return
+
+        # Frames depend on the raw file and on the stretch they were quantized with
+        key = self.cube_file_key()
+        key.update(repr(self.stretch.key()).encode("utf-8"))
+        for name in ("hist", "hist_lo", "hist_hi"):
+            key.update(np.asarray(self.cube_stats[name], dtype=np.float64).tobytes())
+        path = os.path.join(self.temp_dir, f"display_{key.hexdigest()[:16]}.npy")
+        self.prune_temp_dir()
+
+        builder = DisplayCubeBuilder(self.hdr_data, self.cube_stats, self.stretch, path, self)
+        builder.progress.connect(self.on_display_cube_progress)
+        builder.ready.connect(self.on_display_cube_ready)
+        builder.failed.connect(self.on_display_cube_failed)
+        self.display_cube_builder = builder
+        self.start_worker(builder)
+
+    def prune_temp_dir(self):
+        """Trim temp_data to TEMP_DATA_MAX_BYTES, keeping the files the current cube maps.
+
+        Display frames and band-major copies are
+        written per cube and per stretch; the least recently used ones are
+        deleted first.
+        """
+        reader = getattr(self.hdr_data, "reader", None)
+        in_use = [getattr(array, "filename", None)
+                  for array in (self.display_cube, getattr(reader, "band_major", None))]
+        prune_cache_dir(self.temp_dir, TEMP_DATA_MAX_BYTES, keep=in_use)
+
+    def cube_file_key(self):
+        """Return a sha1 of the current cube's path, size and mtime, for temp_dir file names."""
+        raw_info = os.stat(self.hdr_image.filename)
+        return hashlib.sha1(f"{os.path.abspath(self.hdr_path)}|{raw_info.st_size}|{raw_info.st_mtime_ns}".encode("utf-8"))
+
+    def box_spectrum(self, y1, y2, x1, x2):
+        """Return the mean spectrum of hdr_data[y1:y2, x1:x2], or None for an empty box."""
+        region_data = self.hdr_data[y1:y2, x1:x2, :]
+        if region_data.size == 0:
+            return None
+        return np.mean(region_data, axis=(0, 1))
+
+    def objects_segmented(self):
+        """True when the segmentation labels belong to the current cube."""
+        return (self.object_labels is not None and self.hdr_data is not None
+                and self.object_labels.shape == tuple(self.hdr_data.shape[:2]))
+
+    def object_statistics(self, quantiles=False):
+        """Return the per-band statistics of the segmented objects, or None if they are not ready.
+
+        A dict of (objects, bands) arrays over the mask pixels of each
+        bounding box: count, mean, std, min and max, plus the approximate
+        p5, median and p95 when quantiles is set. An ObjectStatsWorker
+        reduces all objects together in one pass over the labelled rows of
+        the cube, and one more for the quantiles; until it is done (or
+        without a segmentation) None is returned. Results are kept until
+        the next segmentation or cube.
+        """
+        if not self.objects_segmented():
+            return None
+        stats = self._spectral_cache.get("objects")
+        if stats is not None and (not quantiles or "median" in stats):
+            return stats
+        if self.object_stats_worker is None:
+            worker = ObjectStatsWorker(self.hdr_data, self.object_labels, self.object_count,
+                                       moments=stats, quantiles=quantiles, parent=self)
+            worker.ready.connect(self.on_object_stats_ready)
+            worker.failed.connect(self.on_object_stats_failed)
+            self.object_stats_worker = worker
+            self.statusBar.showMessage("Computing object statistics...")
+            self.start_worker(worker)
+        return None
+
+    def on_object_stats_ready(self, stats):
+        """Cache the object statistics and run the plot or export waiting for them."""
+        if self.sender() is not self.object_stats_worker:
+            return
+        self.object_stats_worker = None
+        self.statusBar.clearMessage()
+        self._spectral_cache["objects"] = stats
+        self.run_pending_spectrum_action()
+
+    def on_object_stats_failed(self, message):
+        """Log a failed object statistics pass and drop the action waiting for it."""
+        if self.sender() is not self.object_stats_worker:
+            return
+        self.object_stats_worker = None
+        self.statusBar.clearMessage()
+        self._pending_spectrum_action = None
+        self.log_message(f"Could not compute object statistics: {message}", "error")
+
+    def cancel_object_stats(self):
+        """Stop the object statistics pass and forget its results."""
+        if self.object_stats_worker is not None:
+            self.object_stats_worker.cancel()
+            self.object_stats_worker = None
+        self._spectral_cache.pop("objects", None)
+
+    def object_spectrum(self, index, box_data):
+        """Return the mean spectrum of bounding box index, or None if it has no pixels.
+
+        Segmented boxes use their mask pixels; boxes drawn after the last
+        segmentation fall back to the box rectangle.
+        """
+        stats = self.object_statistics()
+        if stats is not None and index < self.object_count:
+            return stats["mean"][index] if stats["count"][index].any() else None
+        x1 = int(box_data['x'])
+        y1 = int(box_data['y'])
+        x2 = int(x1 + box_data['width'])
+        y2 = int(y1 + box_data['height'])
+        return self.box_spectrum(y1, y2, x1, x2)
+
+    def on_display_cube_progress(self, percent):
+        if self.sender() is not self.display_cube_builder:
+            return
+        self.statusBar.showMessage(f"Preparing display frames ({percent}%)")
+
+    def on_display_cube_ready(self, cube):
+        """Switch band display to the precomputed frames."""
+        if self.sender() is not self.display_cube_builder:
+            return
+        self.display_cube_builder = None
+        self.display_cube = cube
+        self.prune_temp_dir()
+        self.statusBar.clearMessage()
+        self.log_message("Display frames ready", "info")
+
+    def on_display_cube_failed(self, message):
+        if self.sender() is not self.display_cube_builder:
+            return
+        self.display_cube_builder = None
+        self.statusBar.clearMessage()
+        self.log_message(f"Could not prepare display frames: {message}", "warning")
+
+    def on_stats_failed(self, message):
+        """Log a failed statistics pass; display falls back to per-band values."""
+        if self.sender() is not self.stats_worker:
+            return
+        self.stats_worker = None
+        self.statusBar.clearMessage()
+        self.log_message(f"Could not compute band statistics: {message}", "error")
+        self.start_spectrum_pass()
+
+    def full_image_spectrum(self):
+        """Return (spectrum, min, max) of the full-image mean spectrum, or None while it is computed.
+
+        The spectrum is a by-product of the statistics pass, which averages
+        the cube in float64 row blocks off the UI thread; it is kept until
+        the cube changes. If that pass failed, a SpectrumWorker averages the
+        cube instead.
+        """
+        if "full" not in self._spectral_cache:
+            if self.cube_stats is None:
+                if self.hdr_data is not None and self.stats_worker is None and self.spectrum_worker is None:
+                    self.start_spectrum_pass()  # An earlier pass failed; try again
+                return None
+            self.set_full_spectrum(self.cube_stats["mean_spectrum"])
+        return self._spectral_cache["full"]
+
+    def set_full_spectrum(self, spectrum):
+        """Cache the full-image mean spectrum of the current cube with its min and max."""
+        spectrum = np.asarray(spectrum, dtype=np.float64)
+        self._spectral_cache["full"] = (spectrum, float(np.min(spectrum)), float(np.max(spectrum)))
+
+    def start_spectrum_pass(self):
+        """Average the current cube into its full-image spectrum in the background."""
+        if self.hdr_data is None or self.spectrum_worker is not None:
+            return
+        worker = SpectrumWorker(self.hdr_data, self)
+        worker.progress.connect(self.on_spectrum_progress)
+        worker.ready.connect(self.on_spectrum_ready)
+        worker.failed.connect(self.on_spectrum_failed)
+        self.spectrum_worker = worker
+        self.start_worker(worker)
+
+    def on_spectrum_progress(self, percent):
+        """Report the full-image spectrum pass in the status bar."""
+        if self.sender() is not self.spectrum_worker:
+            return
+        self.statusBar.showMessage(f"Computing full-image spectrum ({percent}%)")
+
+    def on_spectrum_ready(self, spectrum):
+        """Install the full-image spectrum and draw any plot that was waiting for it."""
+        if self.sender() is not self.spectrum_worker:
+            return
+        self.spectrum_worker = None
+        self.statusBar.clearMessage()
+        self.set_full_spectrum(spectrum)
+        self.run_pending_spectrum_action()
+
+    def on_spectrum_failed(self, message):
+        """Log a failed full-image spectrum pass and drop the plot waiting for it."""
+        if self.sender() is not self.spectrum_worker:
+            return
+        self.spectrum_worker = None
+        self.statusBar.clearMessage()
+        self._pending_spectrum_action = None
+        self.log_message(f"Could not compute the full-image spectrum: {message}", "error")
+
+    def run_when_spectra_ready(self, action, what):
+        """Run a plot or export again once the spectra it needs have been computed."""
+        self._pending_spectrum_action = action
+        self.log_message(f"The {what} is still being computed; "
+                         "this will continue when it is ready", "info")
+
+    def run_pending_spectrum_action(self):
+        """Run the plot or export requested while spectra were being computed, if any."""
+        action, self._pending_spectrum_action = self._pending_spectrum_action, None
+        if action is not None and self.hdr_data is not None:
+            action()
+
+    def on_cube_load_progress(self, percent, stage):
+        """Report cube loading progress in the status bar."""
+        if self.sender() is not self.cube_loader:
+            return
+        self.statusBar.showMessage(f"Loading {os.path.basename(self.hdr_path)}: {stage} ({percent}%)")
+
+    def on_cube_first_band(self, band_image):
+        """Show the first band while the rest of the cube is still loading."""
+        if self.sender() is not self.cube_loader:
+            return
+        self.display_band_image(band_image)
+
+    def on_band_cache_ready(self):
+        """Log when a BIP cube switches to its band-major cache."""
+        if self.sender() is not self.cube_loader:
+            return
+        self.prune_temp_dir()
+        self.statusBar.clearMessage()
+        self.log_message("Band-major cache ready for BIP cube", "info")
+
+    def on_cube_load_failed(self, message):
+        """Handle a failed background load."""
+        if self.sender() is not self.cube_loader:
+            return
+        self.cube_loader = None
+        self.statusBar.clearMessage()
+        self.log_message(f"Error: {message}", "error")
+
+    def on_cube_loaded(self, hdr_image, data):
+        """Install the loaded cube and adjust UI based on actual band count."""
+        if self.sender() is not self.cube_loader:
+            return
+        self.statusBar.clearMessage()
         try:
-            hdr_image = spectral.open_image(self.hdr_path)
-            self.hdr_data = hdr_image.load()
-            
-            if self.hdr_data is None or len(self.hdr_data.shape) < 3:
+            if data is None or len(data.shape) < 3:
                 raise ValueError("Invalid HDR file structure")
                 
             # Add validation for data dimensions
-            if self.hdr_data.shape[0] == 0 or self.hdr_data.shape[1] == 0:
+            if data.shape[0] == 0 or data.shape[1] == 0:
                 raise ValueError("Empty image dimensions")
+
+            self.hdr_image = hdr_image
+            self.hdr_data = data
+            self.invalidate_band_views()
+            self.reset_view_zoom()
                 
             # Get the number of bands from the loaded data
             num_bands = self.hdr_data.shape[2]
@@ -1283,47 +1937,385 @@ class UI_Checker(QtWidgets.QDialog, Ui_Dialog):
             
             # Log the number of bands found
             self.log_message(f"Loaded HDR file with {num_bands} bands", "info")
+            if isinstance(self.hdr_data, H5Cube):
+                self.log_message("Using HDF5 working cache", "info")
+            elif is_memmapped(self.hdr_data):
+                self.log_message("Large cube: using memory-mapped access", "info")
             
             # Initialize to first band and update display
             self.current_band = 0
+            self.horizontalSlider.setValue(0)
             self.update_hdr_band()
             self.log_message("HDR file loaded successfully", "success")
-        except FileNotFoundError:
-            self.log_message("Error: HDR file not found", "error")
+
+            self.start_stats_pass()
         except ValueError as e:
             self.log_message(f"Error: {str(e)}", "error")
         except Exception as e:
             self.log_message(f"Unexpected error: {str(e)}", "error")
 
-    def update_hdr_band(self):
+    def request_band_render(self):
+        """Queue a redraw of the slider's band, merging requests made before it runs."""
+        if not self._render_scheduled:
+            self._render_scheduled = True
+            QTimer.singleShot(0, self.render_requested_band)
+
+    def render_requested_band(self):
+        """Draw the band the slider points at now and record how long it took."""
+        self._render_scheduled = False
+        if self.hdr_data is None or (self.horizontalSlider.value() == self.current_band and self._shown_level is not None):
+            return
+        coarser = self.drag_coarsening()
+        start = time.perf_counter()
+        self.update_hdr_band(coarser=coarser, log=False)
+        self.last_frame_ms = (time.perf_counter() - start) * 1000.0
+        if coarser == 0:
+            self.frame_time_ms = (self.last_frame_ms if self.frame_time_ms is None
+                                  else 0.7 * self.frame_time_ms + 0.3 * self.last_frame_ms)
+        else:
+            self.refine_timer.start()
+        self.horizontalSlider.setToolTip(f"Band {self.current_band} ({self.last_frame_ms:.0f} ms/frame)")
+
+    def drag_coarsening(self):
+        """Return how many pyramid levels to drop while the slider is dragged.
+
+        Each level has a quarter of the pixels, so frames that take k times
+        the budget are drawn log4(k) levels coarser until the drag settles.
+        """
+        if not self.horizontalSlider.isSliderDown() or self.frame_time_ms is None:
+            return 0
+        if self.frame_time_ms <= self.frame_budget_ms:
+            return 0
+        return int(math.ceil(math.log(self.frame_time_ms / self.frame_budget_ms, 4)))
+
+    def update_hdr_band(self, coarser=0, log=True):
         """Modified to handle both regular and segmented views"""
         if self.hdr_data is not None:
-            self.current_band = self.horizontalSlider.value()
+            band = self.horizontalSlider.value()
+            if band != self.current_band:
+                self._scroll_direction = 1 if band > self.current_band else -1
+            self.current_band = band
 
             # Check if we're in segmented view
             if hasattr(self, 'segmented_hdr_data') and self.segmented_hdr_data is not None:
                 self.update_segmented_band(self.current_band)
             else:
-                # Original HDR band display code
-                band_image = self.hdr_data[:, :, self.current_band]
-                band_image = np.squeeze(band_image)
-                band_image = np.rot90(band_image, k=-1)
-                
-                min_val, max_val = np.min(band_image), np.max(band_image)
-                if max_val > min_val:
-                    band_image = ((band_image - min_val) / (max_val - min_val) * 255).astype(np.uint8)
-                else:
-                    band_image = np.zeros_like(band_image, dtype=np.uint8)
+                # Show the pyramid level matching the current zoom
+                self.show_band_level(self.current_band, coarser)
+                if log:
+                    self.log_message("HDR band updated successfully", "success")
+
+    def render_display_band(self, band_index, step=1):
+        """Read and normalize a band for display at 1/step resolution."""
+        if self.display_cube is not None:
+            return np.ascontiguousarray(self.display_cube[band_index, ::step, ::step])
+        return render_band(self.hdr_data, band_index, step, self.cube_stats, self.stretch)
+
+    def display_size(self):
+        """Return (width, height) of the full-resolution band in display orientation."""
+        rows, cols = self.hdr_data.shape[:2]
+        return rows, cols
+
+    def current_view_scale(self):
+        """Return screen pixels per full-resolution image pixel in graphicsView."""
+        return self.fit_scale(self.graphicsView) * self.view_zoom
+
+    def fit_scale(self, view):
+        """Return the scale at which the full band fits a view."""
+        width, height = self.display_size()
+        viewport = view.viewport().rect()
+        return min(viewport.width() / float(width), viewport.height() / float(height))
+
+    def show_band_level(self, band_index, coarser=0):
+        """Display a band at the pyramid level that matches the view scale.
+
+        coarser drops that many extra levels, for quick frames during a drag.
+        """
+        level = min(MAX_LEVEL, choose_level(self.current_view_scale()) + coarser)
+        window, windowed = self.tile_window(self.graphicsView, self.view_zoom, level)
+        self.show_band_tiles(level, window, self.band_renderer(band_index, level, windowed), band_index)
+        self._shown_level = level
+        self._shown_window = window if windowed else None
+        if not windowed:
+            self.prefetch_timer.start()
+
+    def tile_window(self, view, zoom, level):
+        """Return (window, windowed): the display window a view's tiles must cover.
+
+        When zoomed in this is the visible area plus a margin, otherwise the
+        whole band.
+        """
+        if self.visible_window(level, view, zoom) is not None:
+            return self.view_window(level, WINDOW_MARGIN, view), True
+        width, height = self.display_size()
+        return (0, 0, width, height), False
+
+    def band_renderer(self, band_index, level, windowed):
+        """Return render(window) drawing a band level's tiles.
+
+        Whole bands come from the shared pyramid cache, or the display cube
+        at full resolution; zoomed-in windows are read on their own. Adaptive
+        (CLAHE) stretches are always rendered for the whole level and cut
+        into tiles, so that the tiles share one equalization.
+        """
+        step = 2 ** level
+        if windowed and self.stretch.is_global:
+            return self.window_renderer(band_index, level)
+        if self.display_cube is not None and level == 0:
+            # Full-resolution frames are already quantized; no cache entry needed
+            image = self.display_cube[band_index]
+        else:
+            pyramid = BandPyramid(band_index, lambda step: self.render_display_band(band_index, step),
+                                  self._band_cache)
+            image = pyramid.level(level)
+        return lambda window: crop_window(image, window, step)
+
+    def view_window(self, level, margin=0.0, view=None):
+        """Return the display window of a view's viewport (graphicsView by default), aligned to a level's grid."""
+        view = view or self.graphicsView
+        width, height = self.display_size()
+        visible = view.mapToScene(view.viewport().rect()).boundingRect()
+        return align_window(visible.left(), visible.top(), visible.right(), visible.bottom(),
+                            width, height, 2 ** level, margin)
+
+    def visible_window(self, level, view=None, zoom=None):
+        """Return the visible display window if only it should be rendered, else None.
+
+        Windows are used when zoomed in far enough that most of the band is
+        off screen, and only once the cube statistics fix each band's stretch,
+        so that separately rendered windows match. Adaptive (CLAHE)
+        stretches depend on the whole frame and are never windowed.
+        """
+        zoom = self.view_zoom if zoom is None else zoom
+        if zoom <= 1.0 or (self.cube_stats is None and self.display_cube is None):
+            return None
+        if not self.stretch.is_global:
+            return None
+        window = self.view_window(level, view=view)
+        width, height = self.display_size()
+        if (window[2] - window[0]) * (window[3] - window[1]) > MAX_WINDOW_FRACTION * width * height:
+            return None
+        return window
+
+    def window_renderer(self, band_index, level):
+        """Return render(window) drawing display windows of a band at a pyramid level.
+
+        A cached level is cropped; otherwise the window is read from the
+        display cube or the cube.
+        """
+        step = 2 ** level
+        cached = self._band_cache.get(band_index, level)
+        if cached is not None:
+            return lambda window: crop_window(cached, window, step)
+        if self.display_cube is not None:
+            return lambda window: crop_window(self.display_cube[band_index], window, step, strided=True)
+        return lambda window: render_band(self.hdr_data, band_index, step, self.cube_stats, self.stretch,
+                                          window=window)
+
+    def request_view_refresh(self):
+        """Queue a check of the band window after the view scrolled, merging repeated scroll steps."""
+        if not self._view_refresh_scheduled:
+            self._view_refresh_scheduled = True
+            QTimer.singleShot(0, self.refresh_band_level)
+
+    def refresh_band_level(self):
+        """Swap in a finer or coarser level after the zoom changed, or a new window after a pan."""
+        self._view_refresh_scheduled = False
+        if self.hdr_data is None or self.composite is not None or self.band_ratio is not None:
+            return
+        if hasattr(self, 'segmented_hdr_data') and self.segmented_hdr_data is not None:
+            return
+        level = choose_level(self.current_view_scale())
+        visible = self.visible_window(level)
+        if self._shown_window is None:
+            covered = visible is None
+        else:
+            covered = visible is not None and window_contains(self._shown_window, visible)
+        if level != self._shown_level or not covered:
+            self.show_band_level(self.current_band)
+
+    def invalidate_band_views(self):
+        """Drop rendered levels after the cube or its display range changed."""
+        self.prefetch_timer.stop()
+        if self.band_prefetcher is not None:
+            self.band_prefetcher.cancel()
+            self.band_prefetcher = None
+        self._band_cache.clear()
+        self._shown_level = None
+        self._shown_window = None
+        self.tile_layer.invalidate()
+        if self.display_cube_builder is not None:
+            self.display_cube_builder.cancel()
+            self.display_cube_builder = None
+        self.display_cube = None
+
+    def start_band_prefetch(self, bands=None):
+        """Render uncached bands ahead of time.
+
+        By default these are the bands around the slider, favouring the
+        scroll direction; playback passes the bands it will show next.
+        """
+        if self.hdr_data is None or self._shown_level is None:
+            return
+        if hasattr(self, 'segmented_hdr_data') and self.segmented_hdr_data is not None:
+            return
+        level = self._shown_level
+        if self.display_cube is not None and level == 0:
+            return  # Every full-resolution frame is already available
+        if self._shown_window is not None:
+            return  # Zoomed in; windows are cheap to render and whole bands are not needed
+        if bands is None:
+            bands = prefetch_order(self.current_band, self._scroll_direction, self.hdr_data.shape[2])
+        bands = [band for band in bands if (band, level) not in self._band_cache]
+        if self.band_prefetcher is not None:
+            self.band_prefetcher.cancel()
+            self.band_prefetcher = None
+        if not bands:
+            return
+
+        prefetcher = BandPrefetcher(self.hdr_data, bands, level, self.cube_stats, self.stretch, self)
+        prefetcher.band_ready.connect(self.on_band_prefetched)
+        prefetcher.finished.connect(self.on_band_prefetch_finished)
+        prefetcher.failed.connect(lambda message: self.log_message(f"Band prefetch failed: {message}", "warning"))
+        self.band_prefetcher = prefetcher
+        self.start_worker(prefetcher)
+
+    def on_band_prefetch_finished(self):
+        if self.sender() is self.band_prefetcher:
+            self.band_prefetcher = None
+
+    def on_band_prefetched(self, band, level, image):
+        """Store a band rendered ahead of time by the prefetcher."""
+        if self.sender() is not self.band_prefetcher:
+            return  # Rendered for a cube or stretch that is no longer shown
+        self._band_cache.put(band, level, image)
+
+    def display_band_image(self, band_image):
+        """Normalize a band (in data orientation) and show it in graphicsView."""
+        band_image = np.rot90(np.squeeze(band_image), k=-1)
+        frame = self.frame_buffer(band_image.shape)
+        self.set_band_pixmap(stretch_image(band_image, self.stretch, out=frame), 1)
+
+    def set_band_pixmap(self, band_image, scale):
+        """Show a uint8 image covering the band at the given decimation factor.
+
+        Scene coordinates stay in full-resolution pixels whatever the level,
+        so bounding boxes and zoom are unaffected by the level on screen.
+        """
+        self.show_frame(band_image, scale)
+        self.fit_band_scene()
 
-                height, width = band_image.shape
-                band_image_bytes = band_image.tobytes()
-                image = QtGui.QImage(band_image_bytes, width, height, width, QtGui.QImage.Format_Grayscale8)
-                pixmap = QtGui.QPixmap.fromImage(image)
+    def show_band_tiles(self, level, window, render, content):
+        """Show the tiles of a band level covering a display window.
 
-                self.scene.clear()
-                self.scene.addItem(QGraphicsPixmapItem(pixmap))
-                self.graphicsView.fitInView(self.scene.itemsBoundingRect(), QtCore.Qt.KeepAspectRatio)
-                self.log_message("HDR band updated successfully", "success")
+        render(tile_window) draws a tile; content (the band index) tells
+        tiles already showing it apart from those to redraw.
+        """
+        self.band_pixmap_item().setPixmap(QtGui.QPixmap())
+        self.tile_layer.show(level, window, self.display_size(), render, content)
+        self.fit_band_scene()
+
+    def fit_band_scene(self):
+        """Keep the scene at the full-resolution band size and fit it while not zoomed."""
+        if self.hdr_data is not None:
+            full_width, full_height = self.display_size()
+            self.scene.setSceneRect(0, 0, full_width, full_height)
+        if self.view_zoom == 1.0:
+            self.graphicsView.fitInView(self.scene.sceneRect(), QtCore.Qt.KeepAspectRatio)
+
+    def frame_buffer(self, shape):
+        """Return the reusable uint8 buffer for display frames, resized if needed."""
+        if self._frame_buffer is None or self._frame_buffer.shape != tuple(shape):
+            self._frame_buffer = np.empty(shape, dtype=np.uint8)
+        return self._frame_buffer
+
+    def band_pixmap_item(self):
+        """Return the scene's persistent band item, recreating it after scene.clear()."""
+        try:
+            if self.band_item is not None and self.band_item.scene() is self.scene:
+                return self.band_item
+        except RuntimeError:
+            pass  # Deleted along with the rest of the scene
+        self.band_item = QGraphicsPixmapItem()
+        self.band_item.setZValue(-1)  # Keep bounding boxes above the image
+        self.scene.addItem(self.band_item)
+        return self.band_item
+
+    def show_frame(self, image, scale=1):
+        """Show a display-oriented uint8 image (grayscale or RGB) in the band item.
+
+        The QImage wraps the array's memory, so the only copy is the upload
+        into the pixmap. Band tiles are removed; other scene items such as
+        bounding boxes are kept.
+        """
+        self.tile_layer.clear()
+        height, width = image.shape[:2]
+        item = self.band_pixmap_item()
+        item.setPixmap(uint8_pixmap(image))
+        item.setScale(scale)
+        self.scene.setSceneRect(0, 0, width * scale, height * scale)
+
+    def show_stretch_menu(self, pos):
+        """Offer the contrast stretch modes for the band view."""
+        labels = {
+            "minmax": "Min/max",
+            "percentile": "Percentile (1-99%)",
+            "gamma": "Gamma (percentile, \u03b3 0.6)",
+            "equalize": "Histogram equalization",
+            "clahe": "CLAHE",
+        }
+        menu = QtWidgets.QMenu(self)
+        actions = {}
+        for mode in STRETCH_MODES:
+            action = menu.addAction(labels[mode])
+            action.setCheckable(True)
+            action.setChecked(mode == self.stretch.mode)
+            actions[action] = mode
+        menu.addSeparator()
+        compare_action = menu.addAction("Compare bands...")
+        compare_action.setEnabled(self.hdr_data is not None)
+        ratio_action = menu.addAction("Band ratio...")
+        ratio_action.setEnabled(self.hdr_data is not None)
+        chosen = menu.exec_(self.graphicsView.viewport().mapToGlobal(pos))
+        if chosen is compare_action:
+            self.show_compare_dialog()
+        elif chosen is ratio_action:
+            self.show_ratio_dialog()
+        elif chosen is not None and actions[chosen] != self.stretch.mode:
+            self.set_stretch(Stretch(actions[chosen]))
+
+    def set_stretch(self, stretch):
+        """Switch the contrast stretch and redraw with it."""
+        self.stretch = stretch
+        self.invalidate_band_views()
+        self._segmented_band_cache.clear()
+        self.start_display_cube_build()
+        if self.hdr_data is not None:
+            self.update_hdr_band(log=False)
+        self.log_message(f"Contrast stretch: {stretch.mode}", "info")
+
+    def on_view_wheel(self, event):
+        """Zoom the band view around the cursor with the mouse wheel."""
+        if self.hdr_data is None:
+            return
+        step = 1.25 if event.angleDelta().y() > 0 else 1 / 1.25
+        new_zoom = max(1.0, min(self.max_view_zoom, self.view_zoom * step))
+        if new_zoom == self.view_zoom:
+            return
+
+        factor = new_zoom / self.view_zoom
+        self.view_zoom = new_zoom
+        if new_zoom == 1.0:
+            self.graphicsView.fitInView(self.scene.sceneRect(), QtCore.Qt.KeepAspectRatio)
+        else:
+            self.graphicsView.setTransformationAnchor(QtWidgets.QGraphicsView.AnchorUnderMouse)
+            self.graphicsView.scale(factor, factor)
+        self.refresh_band_level()
+
+    def reset_view_zoom(self):
+        """Return the band view to fit-in-view."""
+        self.view_zoom = 1.0
+        self.graphicsView.resetTransform()
 
     def display_hdr_data(self, data):
         """Display HDR data in the graphics view."""
@@ -1388,12 +2380,275 @@ class UI_Checker(QtWidgets.QDialog, Ui_Dialog):
         except Exception as e:
             self.log_message(f"Error displaying PNG image: {str(e)}", "error")
 
+    def show_composite_dialog(self, pos=None):
+        """Show a false-colour composite of three bands while the dialog is open."""
+        if self.hdr_data is None:
+            self.log_message("Load an HDR file before building a composite", "warning")
+            return
+
+        dialog = QtWidgets.QDialog(self)
+        dialog.setWindowTitle("False-colour Composite")
+        dialog.setFixedWidth(280)
+        layout = QtWidgets.QFormLayout()
+
+        band_count = self.hdr_data.shape[2]
+        wavelengths = band_wavelengths(self.hdr_image) if self.hdr_image is not None else None
+        preset_input = QtWidgets.QComboBox()
+        preset_input.addItem("Custom")
+        if wavelengths is not None and len(wavelengths) == band_count:
+            preset_input.addItems(list(COMPOSITE_PRESETS))
+        layout.addRow("Preset:", preset_input)
+
+        # Default to the last, middle and first band
+        defaults = (band_count - 1, band_count // 2, 0)
+        channel_inputs = []
+        for name, default in zip(("Red", "Green", "Blue"), defaults):
+            spin_box = QtWidgets.QSpinBox()
+            spin_box.setRange(0, band_count - 1)
+            spin_box.setValue(default)
+            layout.addRow(f"{name} band:", spin_box)
+            channel_inputs.append(spin_box)
+
+        def update_composite():
+            self.show_composite([spin_box.value() for spin_box in channel_inputs])
+
+        def apply_preset(name):
+            if name not in COMPOSITE_PRESETS:
+                return
+            for spin_box, band in zip(channel_inputs, preset_bands(wavelengths, name)):
+                spin_box.blockSignals(True)
+                spin_box.setValue(band)
+                spin_box.blockSignals(False)
+            update_composite()
+
+        for spin_box in channel_inputs:
+            spin_box.valueChanged.connect(update_composite)
+        preset_input.currentTextChanged.connect(apply_preset)
+
+        close_button = QtWidgets.QPushButton("Close")
+        close_button.clicked.connect(dialog.accept)
+        layout.addRow(close_button)
+        dialog.setLayout(layout)
+
+        self.composite = RGBComposite(self.hdr_data, self.cube_stats)
+        update_composite()
+        dialog.exec_()
+
+        # Back to the single-band view
+        self.composite = None
+        self.statusBar.clearMessage()
+        self.update_hdr_band(log=False)
+
+    def show_composite(self, bands):
+        """Display bands (red, green, blue) as a false-colour image."""
+        try:
+            image = self.composite.set_bands(bands)
+            self.show_frame(image)
+            self.graphicsView.fitInView(self.scene.sceneRect(), QtCore.Qt.KeepAspectRatio)
+            self.statusBar.showMessage(f"Composite R: {bands[0]}  G: {bands[1]}  B: {bands[2]}")
+        except Exception as e:
+            self.log_message(f"Error displaying composite: {str(e)}", "error")
+
+    def show_ratio_dialog(self):
+        """Show a colormapped ratio of two bands, updated live while the dialog is open."""
+        if self.hdr_data is None:
+            self.log_message("Load an HDR file before computing a band ratio", "warning")
+            return
+
+        dialog = QtWidgets.QDialog(self)
+        dialog.setWindowTitle("Band Ratio")
+        dialog.setFixedWidth(300)
+        layout = QtWidgets.QFormLayout()
+
+        mode_labels = {"difference": "(A - B) / (A + B)", "ratio": "A / B"}
+        mode_input = QtWidgets.QComboBox()
+        for mode in RATIO_MODES:
+            mode_input.addItem(mode_labels[mode], mode)
+        layout.addRow("Index:", mode_input)
+
+        # Default to NIR over red (NDVI) when the bands have wavelengths
+        band_count = self.hdr_data.shape[2]
+        wavelengths = band_wavelengths(self.hdr_image) if self.hdr_image is not None else None
+        if wavelengths is not None and len(wavelengths) == band_count:
+            defaults = [int(np.argmin(np.abs(wavelengths - target))) for target in RATIO_DEFAULT_WAVELENGTHS]
+        else:
+            defaults = [band_count - 1, band_count // 2]
+        band_inputs = []
+        for name, default in zip(("Band A", "Band B"), defaults):
+            spin_box = QtWidgets.QSpinBox()
+            spin_box.setRange(0, band_count - 1)
+            spin_box.setValue(default)
+            layout.addRow(f"{name}:", spin_box)
+            band_inputs.append(spin_box)
+
+        def update_ratio():
+            self.show_band_ratio(band_inputs[0].value(), band_inputs[1].value(), mode_input.currentData())
+
+        for spin_box in band_inputs:
+            spin_box.valueChanged.connect(update_ratio)
+        mode_input.currentIndexChanged.connect(update_ratio)
+
+        close_button = QtWidgets.QPushButton("Close")
+        close_button.clicked.connect(dialog.accept)
+        layout.addRow(close_button)
+        dialog.setLayout(layout)
+
+        # Operands are read at the resolution on screen
+        step = 2 ** choose_level(self.current_view_scale())
+        self.band_ratio = BandRatio(self.hdr_data, step)
+        update_ratio()
+        dialog.exec_()
+
+        # Back to the single-band view
+        self.band_ratio = None
+        self.statusBar.clearMessage()
+        self.update_hdr_band(log=False)
+
+    def show_band_ratio(self, band_a, band_b, mode):
+        """Display the ratio of bands A and B through its colormap."""
+        try:
+            values = self.band_ratio.compute(band_a, band_b, mode)
+            low, high = ratio_display_range(values, mode)
+            image = apply_colormap(values, low, high, colormap_lut(RATIO_COLORMAPS[mode]))
+            self.show_frame(image, self.band_ratio.step)
+            full_width, full_height = self.display_size()
+            self.scene.setSceneRect(0, 0, full_width, full_height)
+            self.graphicsView.fitInView(self.scene.sceneRect(), QtCore.Qt.KeepAspectRatio)
+            symbol = "-" if mode == "difference" else "/"
+            self.statusBar.showMessage(f"Band {band_a} {symbol} band {band_b}: "
+                                       f"{RATIO_COLORMAPS[mode]} over {low:.3g} to {high:.3g}")
+        except Exception as e:
+            self.log_message(f"Error displaying band ratio: {str(e)}", "error")
+
+    def show_compare_dialog(self):
+        """Show several bands side by side with their pan and zoom kept in step.
+
+        The panels render through the same band cache and pyramid as the
+        main view, so a panel only costs the tiles it shows.
+        """
+        if self.hdr_data is None:
+            self.log_message("Load an HDR file before comparing bands", "warning")
+            return
+
+        band_count = self.hdr_data.shape[2]
+        default_bands = sorted({self.current_band, band_count // 3, 2 * band_count // 3, band_count - 1})
+        dialog = QtWidgets.QDialog(self)
+        dialog.setWindowTitle("Compare Bands")
+        dialog.resize(900, 640)
+        layout = QtWidgets.QVBoxLayout()
+        bands_row = QtWidgets.QHBoxLayout()
+        bands_row.addWidget(QtWidgets.QLabel("Bands:"))
+        bands_input = QtWidgets.QLineEdit(", ".join(str(band) for band in default_bands))
+        bands_input.setToolTip("Comma-separated bands or ranges, e.g. 12, 40-42")
+        bands_row.addWidget(bands_input)
+        layout.addLayout(bands_row)
+        grid = QtWidgets.QGridLayout()
+        layout.addLayout(grid, 1)
+        close_button = QtWidgets.QPushButton("Close")
+        close_button.clicked.connect(dialog.accept)
+        layout.addWidget(close_button)
+        dialog.setLayout(layout)
+
+        wavelengths = band_wavelengths(self.hdr_image) if self.hdr_image is not None else None
+        if wavelengths is not None and len(wavelengths) != band_count:
+            wavelengths = None
+
+        def set_bands():
+            try:
+                bands = parse_band_list(bands_input.text(), band_count)
+            except ValueError as e:
+                self.log_message(f"Invalid band list: {str(e)}", "warning")
+                return
+            self.clear_compare_panels()
+            columns = int(math.ceil(math.sqrt(len(bands))))
+            for index, band in enumerate(bands):
+                title = f"Band {band}" if wavelengths is None else f"Band {band} ({wavelengths[band]:.0f} nm)"
+                box = QtWidgets.QGroupBox(title)
+                box_layout = QtWidgets.QVBoxLayout(box)
+                box_layout.setContentsMargins(2, 2, 2, 2)
+                panel = BandPanel(band)
+                panel.wheel_zoom.connect(self.on_compare_wheel)
+                panel.resized.connect(self.request_compare_refresh)
+                panel.horizontalScrollBar().valueChanged.connect(lambda _, panel=panel: self.sync_compare_panels(panel))
+                panel.verticalScrollBar().valueChanged.connect(lambda _, panel=panel: self.sync_compare_panels(panel))
+                box_layout.addWidget(panel)
+                grid.addWidget(box, index // columns, index % columns)
+                self.compare_panels.append(panel)
+            self.request_compare_refresh()
+
+        bands_input.editingFinished.connect(set_bands)
+        self.compare_zoom = 1.0
+        self._compare_center = None
+        set_bands()
+        dialog.exec_()
+        self.clear_compare_panels()
+
+    def clear_compare_panels(self):
+        """Remove the compare panels and their tiles."""
+        for panel in self.compare_panels:
+            panel.tiles.clear()
+            panel.parentWidget().deleteLater()
+        self.compare_panels = []
+
+    def request_compare_refresh(self):
+        """Queue a redraw of the compare panels, merging repeated pan, zoom and resize steps."""
+        if not self._compare_refresh_scheduled:
+            self._compare_refresh_scheduled = True
+            QTimer.singleShot(0, self.refresh_compare_panels)
+
+    def refresh_compare_panels(self):
+        """Apply the shared zoom and centre to every panel and show the tiles each one needs."""
+        self._compare_refresh_scheduled = False
+        if self.hdr_data is None or not self.compare_panels:
+            return
+        width, height = self.display_size()
+        if self._compare_center is None:
+            self._compare_center = QtCore.QPointF(width / 2.0, height / 2.0)
+        self._compare_syncing = True
+        try:
+            for panel in self.compare_panels:
+                scale = self.fit_scale(panel) * self.compare_zoom
+                panel.scene().setSceneRect(0, 0, width, height)
+                panel.setTransform(QtGui.QTransform.fromScale(scale, scale))
+                panel.centerOn(self._compare_center)
+                level = choose_level(scale)
+                window, windowed = self.tile_window(panel, self.compare_zoom, level)
+                panel.tiles.show(level, window, (width, height),
+                                 self.band_renderer(panel.band, level, windowed), panel.band)
+        finally:
+            self._compare_syncing = False
+
+    def sync_compare_panels(self, panel):
+        """Pan every compare panel to where the given panel was scrolled."""
+        if self._compare_syncing:
+            return
+        self._compare_center = panel.mapToScene(panel.viewport().rect().center())
+        self.request_compare_refresh()
+
+    def on_compare_wheel(self, panel, event):
+        """Zoom all compare panels around the cursor position in one of them."""
+        step = 1.25 if event.angleDelta().y() > 0 else 1 / 1.25
+        new_zoom = max(1.0, min(self.max_view_zoom, self.compare_zoom * step))
+        if new_zoom == self.compare_zoom:
+            return
+        # Keep the scene point under the cursor in place
+        cursor = panel.mapToScene(event.pos())
+        center = panel.mapToScene(panel.viewport().rect().center())
+        factor = self.compare_zoom / new_zoom
+        self._compare_center = QtCore.QPointF(cursor.x() + (center.x() - cursor.x()) * factor,
+                                              cursor.y() + (center.y() - cursor.y()) * factor)
+        self.compare_zoom = new_zoom
+        self.refresh_compare_panels()
+
     def clear_display(self):
         self.scene.clear()
         self.update_ui()
 
     def clear_all_data(self):
         """Clears all displayed data including images, plots, masks, and segmentation data."""
+        # Stop any cube that is still loading
+        self.cancel_cube_load()
+
         # Clear the main image display
         self.scene.clear()
 
@@ -1405,6 +2660,7 @@ class UI_Checker(QtWidgets.QDialog, Ui_Dialog):
 
         # Reset all data variables
         self.hdr_data = None
+        self.hdr_image = None
         self.image_path = None
         self.hdr_path = None
         self.current_band = 0
@@ -1412,8 +2668,12 @@ class UI_Checker(QtWidgets.QDialog, Ui_Dialog):
         self.bounding_boxes = []  # Clear the list of bounding boxes
         self.current_box_index = 0  # Reset the box index
         self.segmented_hdr_data = None
+        self.object_labels = None
+        self.object_count = 0
+        self.cancel_object_stats()
         self.current_spectral_data = None
         self._band_cache.clear()
+        self._segmented_band_cache.clear()
         self._spectral_cache.clear()
         self._last_mask_hash = None
 
@@ -1433,6 +2693,7 @@ class UI_Checker(QtWidgets.QDialog, Ui_Dialog):
             self.figure = None
             self.cursor_annotation = None
             self.cursor_vline = None
+            self._plot_background = None
 
         # Reset drawing mode
         self.drawing = False
@@ -1679,7 +2940,7 @@ class UI_Checker(QtWidgets.QDialog, Ui_Dialog):
             self.log_message(f"Running segmentation on {device}", "info")
             
             # Get the current band image for segmentation
-            current_band_image = self.hdr_data[:, :, self.current_band]
+            current_band_image = read_band(self.hdr_data, self.current_band)
             current_band_image = np.rot90(current_band_image, k=-1)  # Rotate for display
             
             # Normalize the image
@@ -1698,6 +2959,9 @@ class UI_Checker(QtWidgets.QDialog, Ui_Dialog):
 
             # Initialize combined mask
             combined_mask = np.zeros((image_height, image_width), dtype=np.uint8)
+
+            # Per-object labels; where masks overlap the earlier box keeps the pixel
+            object_labels = np.zeros((image_height, image_width), dtype=np.int32)
             
             # Store individual masks and scores for metrics
             all_masks = []
@@ -1735,22 +2999,20 @@ class UI_Checker(QtWidgets.QDialog, Ui_Dialog):
 
                 # Add the mask to the combined mask
                 combined_mask = np.logical_or(combined_mask, best_mask)
+                object_labels[(object_labels == 0) & best_mask] = len(all_masks)
 
             # Store the combined mask
             self.current_mask = combined_mask
                 
-            # Create a masked version of the HDR data
-            self.segmented_hdr_data = np.zeros_like(self.hdr_data)
-            
             # Rotate mask back to match HDR data orientation
             rotated_mask = np.rot90(self.current_mask, k=1)
             
-            # Create 3D mask
-            mask_3d = np.expand_dims(rotated_mask, axis=2)
-            mask_3d = np.repeat(mask_3d, self.hdr_data.shape[2], axis=2)
-            
-            # Apply mask to HDR data
-            self.segmented_hdr_data = np.where(mask_3d, self.hdr_data, 0)
+            # Masked view of the HDR data; the mask is applied per band on access
+            self.segmented_hdr_data = MaskedCube(self.hdr_data, rotated_mask)
+            self._segmented_band_cache.clear()
+            self.object_labels = np.ascontiguousarray(np.rot90(object_labels, k=1))
+            self.object_count = len(self.bounding_boxes)
+            self.cancel_object_stats()
 
             # Display the current band
             self.update_segmented_band(self.current_band)
@@ -1826,84 +3088,15 @@ class UI_Checker(QtWidgets.QDialog, Ui_Dialog):
         """Display the specified band of the segmented data"""
         if hasattr(self, 'segmented_hdr_data') and self.segmented_hdr_data is not None:
             try:
-                # Get the band data
-                band_image = self.segmented_hdr_data[:, :, band_index].copy()
-                
-                # Rotate the band image for display
-                band_image = np.rot90(band_image, k=-1)
-                
-                # Check if this is a 10-band sample
-                is_10_band = self.hdr_data.shape[2] == 10
-                
-                if is_10_band:
-                    # Create initial mask for segmented regions
-                    segmented_mask = (band_image > 0)
-                    
-                    if np.any(segmented_mask):
-                        # Create a working copy for processing
-                        processed_image = np.zeros_like(band_image, dtype=np.float32)
-                        
-                        # Get values only from segmented regions
-                        segmented_values = band_image[segmented_mask]
-                        
-                        # Calculate robust percentiles for normalization
-                        p1, p99 = np.percentile(segmented_values[segmented_values > 0], (1, 99))
-                        
-                        # Normalize the segmented regions
-                        processed_image[segmented_mask] = np.clip(
-                            ((band_image[segmented_mask] - p1) / (p99 - p1) * 255),
-                            0, 255
-                        )
-                        
-                        # Convert to uint8 for further processing
-                        processed_image = processed_image.astype(np.uint8)
-                        
-                        # Apply CLAHE to the entire image
-                        clahe = cv2.createCLAHE(clipLimit=3.0, tileGridSize=(8, 8))
-                        enhanced_image = clahe.apply(processed_image)
-                        
-                        # Keep only the enhanced regions where we had segmented data
-                        processed_image = np.zeros_like(enhanced_image)
-                        processed_image[segmented_mask] = enhanced_image[segmented_mask]
-                        
-                        # Strong contrast enhancement for segmented regions
-                        alpha = 2.0  # Increased contrast
-                        beta = 30    # Increased brightness
-                        enhanced = cv2.convertScaleAbs(processed_image, alpha=alpha, beta=beta)
-                        
-                        # Create final image
-                        band_image = np.zeros_like(enhanced)
-                        band_image[segmented_mask] = enhanced[segmented_mask]
-                        
-                        # Add edge enhancement to make boundaries more visible
-                        kernel = np.ones((3,3), np.uint8)
-                        dilated = cv2.dilate(band_image, kernel, iterations=1)
-                        edge = dilated - band_image
-                        band_image[edge > 0] = 255  # Make edges white
-                    else:
-                        band_image = np.zeros_like(band_image, dtype=np.uint8)
-                else:
-                    # Standard normalization for other samples
-                    non_zero_mask = band_image != 0
-                    if np.any(non_zero_mask):
-                        min_val = np.min(band_image[non_zero_mask])
-                        max_val = np.max(band_image[non_zero_mask])
-                        if max_val > min_val:
-                            normalized = np.zeros_like(band_image)
-                            normalized[non_zero_mask] = ((band_image[non_zero_mask] - min_val) / (max_val - min_val) * 255)
-                            band_image = normalized.astype(np.uint8)
-                    else:
-                        band_image = np.zeros_like(band_image, dtype=np.uint8)
-
-                # Convert to QImage and display
-                height, width = band_image.shape
-                band_image_bytes = band_image.tobytes()
-                image = QtGui.QImage(band_image_bytes, width, height, width, QtGui.QImage.Format_Grayscale8)
-                pixmap = QtGui.QPixmap.fromImage(image)
-
-                self.scene.clear()
-                self.scene.addItem(QGraphicsPixmapItem(pixmap))
-                self.graphicsView.fitInView(self.scene.itemsBoundingRect(), QtCore.Qt.KeepAspectRatio)
+                # Segmented frames are rendered once per band and stretch
+                band_image = self._segmented_band_cache.get(band_index, 0)
+                if band_image is None:
+                    band_image = self.render_segmented_band(band_index)
+                    self._segmented_band_cache.put(band_index, 0, band_image)
+
+                # Display in the persistent band item
+                self.show_frame(band_image)
+                self.graphicsView.fitInView(self.scene.sceneRect(), QtCore.Qt.KeepAspectRatio)
                 
                 # Calculate and log display coverage
                 non_zero_count = np.count_nonzero(band_image)
@@ -1919,6 +3112,78 @@ class UI_Checker(QtWidgets.QDialog, Ui_Dialog):
                 import traceback
                 print(traceback.format_exc())
 
+    def render_segmented_band(self, band_index):
+        """Render a band of the segmented data as a uint8 display frame."""
+        # Get the band data
+        band_image = read_band(self.segmented_hdr_data, band_index)
+        
+        # Rotate the band image for display
+        band_image = np.rot90(band_image, k=-1)
+        
+        # Check if this is a 10-band sample
+        is_10_band = self.hdr_data.shape[2] == 10
+        
+        if is_10_band:
+            # Create initial mask for segmented regions
+            segmented_mask = (band_image > 0)
+            
+            if np.any(segmented_mask):
+                # Create a working copy for processing
+                processed_image = np.zeros_like(band_image, dtype=np.float32)
+                
+                # Get values only from segmented regions
+                segmented_values = band_image[segmented_mask]
+                
+                # Robust percentiles from a histogram instead of a full sort
+                hist, lo, hi = image_histogram(segmented_values[segmented_values > 0])
+                p1, p99 = (histogram_percentile(hist, [lo], [hi], q)[0] for q in (1, 99))
+                
+                # Normalize the segmented regions
+                processed_image[segmented_mask] = np.clip(
+                    ((band_image[segmented_mask] - p1) / (p99 - p1) * 255),
+                    0, 255
+                )
+                
+                # Convert to uint8 for further processing
+                processed_image = processed_image.astype(np.uint8)
+                
+                # Apply CLAHE to the entire image
+                clahe = cv2.createCLAHE(clipLimit=3.0, tileGridSize=(8, 8))
+                enhanced_image = clahe.apply(processed_image)
+                
+                # Keep only the enhanced regions where we had segmented data
+                processed_image = np.zeros_like(enhanced_image)
+                processed_image[segmented_mask] = enhanced_image[segmented_mask]
+                
+                # Strong contrast enhancement for segmented regions
+                alpha = 2.0  # Increased contrast
+                beta = 30    # Increased brightness
+                enhanced = cv2.convertScaleAbs(processed_image, alpha=alpha, beta=beta)
+                
+                # Create final image
+                band_image = np.zeros_like(enhanced)
+                band_image[segmented_mask] = enhanced[segmented_mask]
+                
+                # Add edge enhancement to make boundaries more visible
+                kernel = np.ones((3,3), np.uint8)
+                dilated = cv2.dilate(band_image, kernel, iterations=1)
+                edge = dilated - band_image
+                band_image[edge > 0] = 255  # Make edges white
+            else:
+                band_image = np.zeros_like(band_image, dtype=np.uint8)
+        else:
+            # Standard normalization for other samples
+            band_image = self.normalize_segmented_band(band_image)
+
+        return band_image
+
+    def normalize_segmented_band(self, band_image):
+        """Stretch the non-zero (segmented) pixels of a display band with the current stretch."""
+        non_zero_mask = band_image != 0
+        if not np.any(non_zero_mask):
+            return np.zeros(band_image.shape, dtype=np.uint8)
+        return stretch_image(band_image, self.stretch, mask=non_zero_mask)
+
     def show_segmented_image(self):
         """Show the segmented image"""
         if not hasattr(self, 'segmented_hdr_data') or self.segmented_hdr_data is None:
@@ -1926,34 +3191,17 @@ class UI_Checker(QtWidgets.QDialog, Ui_Dialog):
             return
 
         # Get the current band of the segmented data
-        band_image = self.segmented_hdr_data[:, :, self.current_band]
+        band_image = read_band(self.segmented_hdr_data, self.current_band)
         
         # Rotate the band image for display
         band_image = np.rot90(band_image, k=-1)
         
         # Normalize the band data for display
-        non_zero_mask = band_image != 0
-        if np.any(non_zero_mask):
-            min_val = np.min(band_image[non_zero_mask])
-            max_val = np.max(band_image[non_zero_mask])
-            if max_val > min_val:
-                normalized = np.zeros_like(band_image)
-                normalized[non_zero_mask] = ((band_image[non_zero_mask] - min_val) / (max_val - min_val) * 255)
-                band_image = normalized.astype(np.uint8)
-            else:
-                band_image = np.zeros_like(band_image, dtype=np.uint8)
-        else:
-            band_image = np.zeros_like(band_image, dtype=np.uint8)
+        band_image = self.normalize_segmented_band(band_image)
 
-        # Convert to QImage and display
-        height, width = band_image.shape
-        band_image_bytes = band_image.tobytes()
-        image = QtGui.QImage(band_image_bytes, width, height, width, QtGui.QImage.Format_Grayscale8)
-        pixmap = QtGui.QPixmap.fromImage(image)
-            
-        self.scene.clear()
-        self.scene.addItem(QGraphicsPixmapItem(pixmap))
-        self.graphicsView.fitInView(self.scene.itemsBoundingRect(), QtCore.Qt.KeepAspectRatio)
+        # Display in the persistent band item
+        self.show_frame(band_image)
+        self.graphicsView.fitInView(self.scene.sceneRect(), QtCore.Qt.KeepAspectRatio)
         self.log_message("Segmented image displayed successfully", "success")
 
     def show_mask(self):
@@ -2055,7 +3303,7 @@ class UI_Checker(QtWidgets.QDialog, Ui_Dialog):
         self.doubleSpinBox.blockSignals(True)
         self.doubleSpinBox.setValue(int(value))  # Convert to integer
         self.doubleSpinBox.blockSignals(False)
-        self.update_hdr_band()
+        self.request_band_render()
 
     def on_spinbox_value_changed(self, value):
         """Handle spinbox value changes"""
@@ -2063,7 +3311,121 @@ class UI_Checker(QtWidgets.QDialog, Ui_Dialog):
         self.horizontalSlider.blockSignals(True)
         self.horizontalSlider.setValue(int(value))  # Convert to integer
         self.horizontalSlider.blockSignals(False)
-        self.update_hdr_band()
+        self.request_band_render()
+
+    def playback_bands(self):
+        """Return the (first, last) band that playback cycles through."""
+        last_band = self.hdr_data.shape[2] - 1
+        if self.playback_range is None:
+            return 0, last_band
+        first, last = self.playback_range
+        first = max(0, min(first, last_band))
+        return first, max(first, min(last, last_band))
+
+    def toggle_playback(self):
+        if self.playback_timer.isActive():
+            self.stop_playback()
+        else:
+            self.start_playback()
+
+    def start_playback(self):
+        """Animate the band view through the playback range at playback_fps."""
+        if self.hdr_data is None:
+            self.log_message("Load an HDR file before starting playback", "warning")
+            return
+        first, last = self.playback_bands()
+        # Continue from the current band when it is inside the range
+        offset = self.current_band - first if first <= self.current_band <= last else 0
+        self._playback_clock = time.perf_counter() - offset / self.playback_fps
+        self._playback_frames = 0
+        self._playback_dropped = 0
+        self._playback_report = time.perf_counter()
+        self._scroll_direction = 1
+        self.playback_timer.start(max(1, int(1000 / self.playback_fps)))
+        self.playButton.setText("\u275A\u275A")
+
+    def stop_playback(self):
+        if not self.playback_timer.isActive():
+            return
+        self.playback_timer.stop()
+        self.playButton.setText("\u25B6")
+        self.statusBar.clearMessage()
+        self.refresh_band_level()
+
+    def playback_tick(self):
+        """Show the band due at this moment; bands whose time has passed are skipped."""
+        if self.hdr_data is None:
+            self.stop_playback()
+            return
+        first, last = self.playback_bands()
+        count = last - first + 1
+        # Frames are indexed by wall-clock time, so slow frames drop bands instead of lagging
+        frame = int((time.perf_counter() - self._playback_clock) * self.playback_fps)
+        band = first + frame % count
+        if band == self.current_band:
+            return
+        expected = first + (self.current_band - first + 1) % count
+        if band != expected:
+            self._playback_dropped += (band - expected) % count
+
+        self.horizontalSlider.blockSignals(True)
+        self.horizontalSlider.setValue(band)
+        self.horizontalSlider.blockSignals(False)
+        self.doubleSpinBox.blockSignals(True)
+        self.doubleSpinBox.setValue(band)
+        self.doubleSpinBox.blockSignals(False)
+        self.update_hdr_band(log=False)
+        self.prefetch_timer.stop()
+        self._playback_frames += 1
+
+        # Keep about a second of upcoming bands rendering in the background
+        if self.band_prefetcher is None:
+            ahead = int(self.playback_fps)
+            self.start_band_prefetch([first + (band - first + i) % count for i in range(1, ahead + 1)])
+
+        now = time.perf_counter()
+        if now - self._playback_report >= 1.0:
+            achieved = self._playback_frames / (now - self._playback_report)
+            self.statusBar.showMessage(
+                f"Playing bands {first}-{last}: {achieved:.1f} fps "
+                f"(target {self.playback_fps:.0f}, {self._playback_dropped} dropped)")
+            self._playback_frames = 0
+            self._playback_dropped = 0
+            self._playback_report = now
+
+    def show_playback_dialog(self, pos=None):
+        """Let the user set the playback band range and frame rate."""
+        dialog = QtWidgets.QDialog(self)
+        dialog.setWindowTitle("Band Playback")
+        dialog.setFixedWidth(260)
+        layout = QtWidgets.QFormLayout()
+
+        band_count = self.hdr_data.shape[2] if self.hdr_data is not None else 1
+        first, last = self.playback_bands() if self.hdr_data is not None else (0, 0)
+        first_input = QtWidgets.QSpinBox()
+        last_input = QtWidgets.QSpinBox()
+        for spin_box, value in ((first_input, first), (last_input, last)):
+            spin_box.setRange(0, max(0, band_count - 1))
+            spin_box.setValue(value)
+        fps_input = QtWidgets.QSpinBox()
+        fps_input.setRange(1, 120)
+        fps_input.setValue(int(self.playback_fps))
+        layout.addRow("First band:", first_input)
+        layout.addRow("Last band:", last_input)
+        layout.addRow("Frames per second:", fps_input)
+
+        apply_button = QtWidgets.QPushButton("Apply")
+        apply_button.clicked.connect(dialog.accept)
+        layout.addRow(apply_button)
+        dialog.setLayout(layout)
+
+        if dialog.exec_() == QtWidgets.QDialog.Accepted:
+            first, last = sorted((first_input.value(), last_input.value()))
+            self.playback_range = None if (first, last) == (0, band_count - 1) else (first, last)
+            self.playback_fps = float(fps_input.value())
+            if self.playback_timer.isActive():
+                self.stop_playback()
+                self.start_playback()
 
     def log_message(self, message, message_type="Function info"):
         """Add a formatted message to listWidget_2"""
@@ -2119,7 +3481,12 @@ class UI_Checker(QtWidgets.QDialog, Ui_Dialog):
         if self.hdr_path is None:
             self.log_message("Error: No data available to export.", "error")
             return
-            
+
+        # The statistics table needs the object quantiles
+        if self.object_statistics(quantiles=True) is None and self.objects_segmented():
+            self.run_when_spectra_ready(self.export_all_data, "object statistics")
+            return
+
         try:
             # Create export directory
             base_dir = os.path.dirname(self.hdr_path)
@@ -2142,17 +3509,10 @@ class UI_Checker(QtWidgets.QDialog, Ui_Dialog):
                 header = ["Band"]
                 
                 # Collect spectral signatures for each segmented object
-                for box_data in self.bounding_boxes:
-                    # Get box coordinates
-                    x1 = int(box_data['x'])
-                    y1 = int(box_data['y'])
-                    x2 = int(x1 + box_data['width'])
-                    y2 = int(y1 + box_data['height'])
-
-                    # Get region data and calculate average spectral signature
-                    region_data = self.hdr_data[y1:y2, x1:x2, :]
-                    if region_data.size > 0:
-                        avg_spectral_signature = np.mean(region_data, axis=(0, 1))
+                for index, box_data in enumerate(self.bounding_boxes):
+                    # Average spectral signature of the object (its mask once segmented)
+                    avg_spectral_signature = self.object_spectrum(index, box_data)
+                    if avg_spectral_signature is not None:
                         all_signatures.append(avg_spectral_signature)
                         header.append(f"{box_data['label']}")
 
@@ -2170,7 +3530,19 @@ class UI_Checker(QtWidgets.QDialog, Ui_Dialog):
                             header=",".join(header),
                             comments='',
                             fmt='%.6f')  # Use 6 decimal places for precision
-                    
+
+                # Per-band statistics table of the segmented objects
+                object_stats = self.object_statistics(quantiles=True)
+                if object_stats is not None:
+                    columns = ("count", "mean", "std", "min", "p5", "median", "p95", "max")
+                    with open(os.path.join(plots_dir, "segmented_objects_spectral_statistics.csv"), 'w') as f:
+                        f.write("Object,Band,Pixels,Mean,Std,Min,P5,Median,P95,Max\n")
+                        for index, box_data in enumerate(self.bounding_boxes[:self.object_count]):
+                            for band in range(self.hdr_data.shape[2]):
+                                values = [object_stats[name][index, band] for name in columns]
+                                f.write(f"{box_data['label']},{band},{int(values[0])},"
+                                        + ",".join(f"{value:.6f}" for value in values[1:]) + "\n")
+
             # # Save the current plot as PNG
             # if hasattr(self, 'figure') and self.figure is not None:
             #     # Save with high resolution
@@ -2189,8 +3561,11 @@ class UI_Checker(QtWidgets.QDialog, Ui_Dialog):
             #               seg_data, delimiter=",", header="Band,Reflectance", comments='')
 
             # Export full image spectral signature
-            if self.hdr_data is not None:
-                full_signature = self.hdr_data.mean(axis=(0, 1))
+            full_spectrum = self.full_image_spectrum() if self.hdr_data is not None else None
+            if self.hdr_data is not None and full_spectrum is None:
+                self.log_message("Full-image spectrum skipped: it is still being computed", "warning")
+            elif full_spectrum is not None:
+                full_signature = full_spectrum[0]
                 full_data = np.column_stack((np.arange(len(full_signature)), full_signature))
                 np.savetxt(os.path.join(plots_dir, "full_spectral_signature.csv"),
                           full_data, delimiter=",", header="Band,Reflectance", comments='')
@@ -2211,7 +3586,7 @@ class UI_Checker(QtWidgets.QDialog, Ui_Dialog):
 
             # 4. Export current segmented image
             if hasattr(self, 'segmented_hdr_data') and self.segmented_hdr_data is not None:
-                current_band = self.segmented_hdr_data[:, :, self.current_band]
+                current_band = read_band(self.segmented_hdr_data, self.current_band)
                 current_band = np.rot90(current_band, k=-1)
                 cv2.imwrite(os.path.join(images_dir, "segmented_image.png"),
                            self.normalize_for_export(current_band))
@@ -2226,7 +3601,7 @@ class UI_Checker(QtWidgets.QDialog, Ui_Dialog):
             # 6. Export all segmented bands
             if hasattr(self, 'segmented_hdr_data') and self.segmented_hdr_data is not None:
                 for band in range(self.segmented_hdr_data.shape[2]):
-                    band_image = self.segmented_hdr_data[:, :, band]
+                    band_image = read_band(self.segmented_hdr_data, band)
                     band_image = np.rot90(band_image, k=-1)
                     cv2.imwrite(os.path.join(bands_dir, f"segmented_band_{band:03d}.png"),
                               self.normalize_for_export(band_image))
@@ -2242,17 +3617,8 @@ class UI_Checker(QtWidgets.QDialog, Ui_Dialog):
             print(traceback.format_exc())
 
     def normalize_for_export(self, image):
-        """Normalize image data for export."""
-        non_zero_mask = image != 0
-        if np.any(non_zero_mask):
-            min_val = np.min(image[non_zero_mask])
-            max_val = np.max(image[non_zero_mask])
-            if max_val > min_val:
-                normalized = np.zeros_like(image)
-                normalized[non_zero_mask] = ((image[non_zero_mask] - min_val) / 
-                                           (max_val - min_val) * 255)
-                return normalized.astype(np.uint8)
-        return np.zeros_like(image, dtype=np.uint8)
+        """Normalize image data for export with the band view's stretch."""
+        return self.normalize_segmented_band(image)
 
     def export_metadata(self, export_dir):
         """Export metadata about the analysis."""
@@ -2407,29 +3773,40 @@ class UI_Checker(QtWidgets.QDialog, Ui_Dialog):
     def on_close(self, event):
         """Handle cleanup when the application is closed"""
         try:
-            # Clear any temporary files
-            if hasattr(self, 'temp_dir') and os.path.exists(self.temp_dir):
-                import shutil
-                shutil.rmtree(self.temp_dir)
-            
+            # Stop background workers before tearing down their data
+            self.cancel_cube_load()
+            for worker in list(self._background_threads):
+                worker.cancel()
+                worker.wait()
+
             # Clear any cached data
             if hasattr(self, '_band_cache'):
                 self._band_cache.clear()
             if hasattr(self, '_spectral_cache'):
                 self._spectral_cache.clear()
+            if hasattr(self, 'sample_index'):
+                self.sample_index.close()
             
             # Clear any loaded data
             self.hdr_data = None
+            self.hdr_image = None
+            self.display_cube = None
             self.image_path = None
             self.hdr_path = None
             self.current_mask = None
             self.segmented_hdr_data = None
+            self.object_labels = None
             self.bounding_boxes = []
             
             # Clear SAM model
             if hasattr(self, 'sam_predictor'):
                 self.sam_predictor = None
             
+            # Clear any temporary files (after releasing memory-mapped caches in them)
+            if hasattr(self, 'temp_dir') and os.path.exists(self.temp_dir):
+                import shutil
+                shutil.rmtree(self.temp_dir, ignore_errors=True)
+            
             # Accept the close event
             event.accept()
         except Exception as e:
@@ -0,0 +1,131 @@
+import numpy as np
+from PyQt5 import QtGui
+from PyQt5.QtCore import pyqtSignal
+from PyQt5.QtWidgets import QGraphicsPixmapItem, QGraphicsScene, QGraphicsView
+
+# Side of a display tile, in pixels of its pyramid level
+TILE_SIZE = 256
+
+
+def uint8_pixmap(image):
+    """Upload a display-oriented uint8 image (grayscale or RGB) into a QPixmap.
+
+    The QImage wraps the array's memory, so the only copy is the upload.
+    """
+    image = np.ascontiguousarray(image)
+    height, width = image.shape[:2]
+    image_format = QtGui.QImage.Format_Grayscale8 if image.ndim == 2 else QtGui.QImage.Format_RGB888
+    qimage = QtGui.QImage(image.data, width, height, image.strides[0], image_format)
+    return QtGui.QPixmap.fromImage(qimage)
+
+
+def tile_range(start, end, span):
+    """Indices of the span-sized tiles overlapping [start, end)."""
+    return range(start // span, -(-end // span))
+
+
+class TileLayer:
+    """A band level shown as fixed-size pixmap tiles in a QGraphicsScene.
+
+    Only the tiles overlapping the requested display window exist; the rest
+    are removed from the scene, so memory follows the viewport instead of
+    the length of the scan. Tiles are keyed by (level, column, row) and
+    shared by all bands: switching band redraws each item in place, and a
+    tile already holding the requested content is left alone, so a pan only
+    draws the tiles it uncovers.
+    """
+    def __init__(self, scene, tile_size=TILE_SIZE, z_value=-1):
+        self.scene = scene
+        self.tile_size = tile_size
+        self.z_value = z_value
+        self._tiles = {}  # (level, column, row) -> [item, content]
+
+    def __len__(self):
+        return len(self._tiles)
+
+    def show(self, level, window, size, render, content):
+        """Show the tiles of a level that cover a display window.
+
+        window is (x0, y0, x1, y1) in full-resolution display pixels and size
+        the band's (width, height). render(tile_window) returns the uint8
+        image of a tile at 1/2**level; it is called once per tile, so it
+        must crop a level rendered as a whole when the stretch is not
+        per-pixel (CLAHE). content identifies what render draws
+        (such as the band index); tiles holding anything else are redrawn.
+        Returns the number of tiles drawn.
+        """
+        self._drop_deleted()
+        step = 2 ** level
+        span = self.tile_size * step
+        width, height = size
+        x0, y0, x1, y1 = window
+        wanted = {(level, column, row)
+                  for column in tile_range(x0, x1, span) for row in tile_range(y0, y1, span)}
+        for key in [key for key in self._tiles if key not in wanted]:
+            self.scene.removeItem(self._tiles.pop(key)[0])
+
+        drawn = 0
+        for key in sorted(wanted):
+            _, column, row = key
+            tile = self._tiles.get(key)
+            if tile is None:
+                item = QGraphicsPixmapItem()
+                item.setZValue(self.z_value)  # Keep bounding boxes above the image
+                item.setScale(step)
+                item.setPos(column * span, row * span)
+                self.scene.addItem(item)
+                tile = self._tiles[key] = [item, None]
+            if tile[1] != content:
+                tile_window = (column * span, row * span,
+                               min(width, (column + 1) * span), min(height, (row + 1) * span))
+                tile[0].setPixmap(uint8_pixmap(render(tile_window)))
+                tile[1] = content
+                drawn += 1
+        return drawn
+
+    def invalidate(self):
+        """Redraw every tile on the next show, e.g. after the stretch changed."""
+        for tile in self._tiles.values():
+            tile[1] = None
+
+    def clear(self):
+        """Remove every tile from the scene."""
+        self._drop_deleted()
+        for item, _ in self._tiles.values():
+            self.scene.removeItem(item)
+        self._tiles.clear()
+
+    def _drop_deleted(self):
+        # scene.clear() deletes the tiles along with every other item
+        for item, _ in self._tiles.values():
+            try:
+                alive = item.scene() is self.scene
+            except RuntimeError:
+                alive = False
+            if not alive:
+                self._tiles.clear()
+            return
+
+
+class BandPanel(QGraphicsView):
+    """A graphics view with its own scene and tile layer, showing one band of a compare grid.
+
+    Zooming is left to the owner: wheel events are re-emitted as
+    wheel_zoom(panel, event), and resized is emitted after a resize so the
+    owner can re-fit the panel.
+    """
+    wheel_zoom = pyqtSignal(object, object)
+    resized = pyqtSignal()
+
+    def __init__(self, band, parent=None):
+        super().__init__(parent)
+        self.band = band
+        self.setScene(QGraphicsScene(self))
+        self.tiles = TileLayer(self.scene())
+
+    def wheelEvent(self, event):
+        self.wheel_zoom.emit(self, event)
+
+    def resizeEvent(self, event):
+        super().resizeEvent(event)
+        self.resized.emit()
@@ -0,0 +1,425 @@
+import os
+import math
+from collections import OrderedDict
+import numpy as np
+from cube_io import CHUNK_BYTES, iter_row_blocks, read_band
+from cube_stats import histogram_percentile
+from stretch import Stretch, apply_local, apply_transfer, band_transfer, cube_transfers, image_histogram, lut_index, stretch_image
+
+# Coarsest pyramid level kept; 2**MAX_LEVEL decimation
+MAX_LEVEL = 6
+
+# Memory budget of rendered band levels kept for scrubbing through bands
+BAND_CACHE_BYTES = 256 * 1024 * 1024
+
+# Largest uint8 display cube (one byte per sample) built for a loaded cube
+DISPLAY_CUBE_MAX_BYTES = 1024 * 1024 * 1024
+
+# Zoomed-in views render the visible window grown by this fraction of its size on
+# each side, so short pans reuse pixels already on screen
+WINDOW_MARGIN = 0.25
+
+# The whole band level is shown instead once the visible window exceeds this
+# fraction of the band
+MAX_WINDOW_FRACTION = 0.5
+
+# Wavelength presets (nm) for false-colour composites, as (red, green, blue)
+COMPOSITE_PRESETS = {
+    "True colour": (640.0, 550.0, 460.0),
+    "Colour infrared": (860.0, 650.0, 550.0),
+    "Red edge": (740.0, 705.0, 560.0),
+}
+
+# Band arithmetic of the ratio view: normalized difference (A - B) / (A + B) and
+# simple ratio A / B, with the colormap each is drawn with
+RATIO_MODES = ("difference", "ratio")
+RATIO_COLORMAPS = {"difference": "RdYlGn", "ratio": "viridis"}
+
+# Default (A, B) wavelengths (nm) of the ratio view: NIR over red, as for NDVI
+RATIO_DEFAULT_WAVELENGTHS = (800.0, 670.0)
+
+
+def to_uint8(image, min_val, max_val, out=None):
+    """Linearly map [min_val, max_val] to 0..255, writing into out if given."""
+    if out is None:
+        out = np.empty(np.shape(image), dtype=np.uint8)
+    if max_val > min_val:
+        scaled = (np.asarray(image, dtype=np.float32) - np.float32(min_val)) * np.float32(255.0 / (max_val - min_val))
+        np.clip(scaled, 0, 255, out=scaled)
+        np.copyto(out, scaled, casting="unsafe")
+    else:
+        out.fill(0)
+    return out
+
+
+def display_band(data, band, step=1):
+    """Read a band in display orientation (rot90, k=-1), sampling every step pixels.
+
+    The row offset keeps the sample aligned with the display origin so that
+    the result equals the full-resolution display image[::step, ::step].
+    """
+    rows = data.shape[0]
+    values = read_band(data, band, slice((rows - 1) % step, None, step), slice(None, None, step))
+    return np.rot90(values, k=-1)
+
+
+def display_window(data, band, window, step=1):
+    """Read an (x0, y0, x1, y1) display window of a band, sampling every step pixels.
+
+    x0 and y0 must be multiples of step (see align_window); the result then
+    equals the full display image[y0:y1:step, x0:x1:step] and only the
+    window is read from the cube.
+    """
+    x0, y0, x1, y1 = window
+    rows = data.shape[0]
+    # Display column x shows data row rows - 1 - x; display row y is data column y
+    last_x = x0 + (len(range(x0, x1, step)) - 1) * step
+    values = read_band(data, band, slice(rows - 1 - last_x, rows - x0, step), slice(y0, y1, step))
+    return np.rot90(values, k=-1)
+
+
+def render_band(data, band, step=1, stats=None, stretch=None, window=None):
+    """Read a band (or a display window of it) in display orientation and stretch it to uint8.
+
+    The stretch parameters come from the band's cached histogram in the cube
+    statistics when given, otherwise from a histogram of the image itself.
+    """
+    stretch = stretch or Stretch()
+    image = display_band(data, band, step) if window is None else display_window(data, band, window, step)
+    if stats is None:
+        return stretch_image(image, stretch)
+    low, high, lut = band_transfer(stats, band, stretch)
+    return apply_local(apply_transfer(image, low, high, lut), stretch)
+
+
+def align_window(left, top, right, bottom, width, height, step=1, margin=0.0):
+    """Return the integer (x0, y0, x1, y1) display window covering a scene rectangle.
+
+    The rectangle is grown by margin times its size on each side, clipped to
+    the width x height band and snapped outwards to the step grid, so that a
+    window read at 1/step lines up with the level image[::step, ::step].
+    """
+    grow_x = (right - left) * margin
+    grow_y = (bottom - top) * margin
+    x0 = max(0, int(math.floor((left - grow_x) / step)) * step)
+    y0 = max(0, int(math.floor((top - grow_y) / step)) * step)
+    x1 = min(width, int(math.ceil((right + grow_x) / step)) * step)
+    y1 = min(height, int(math.ceil((bottom + grow_y) / step)) * step)
+    return x0, y0, max(x0, x1), max(y0, y1)
+
+
+def window_contains(outer, inner):
+    """True if display window inner lies within outer."""
+    return outer[0] <= inner[0] and outer[1] <= inner[1] and inner[2] <= outer[2] and inner[3] <= outer[3]
+
+
+def crop_window(image, window, step=1, strided=False):
+    """Return the part of a level image (1/step of the band) covering a display window.
+
+    With strided, image is the full-resolution band and is sampled every
+    step pixels instead.
+    """
+    x0, y0, x1, y1 = window
+    if strided:
+        return image[y0:y1:step, x0:x1:step]
+    return image[y0 // step:-(-y1 // step), x0 // step:-(-x1 // step)]
+
+
+def prefetch_order(current, direction, band_count, ahead=8, behind=3):
+    """Return the bands to render around current, nearest first.
+
+    direction is +1/-1 for the way the slider last moved (0 if unknown);
+    that side gets `ahead` bands and the other side `behind`.
+    """
+    if direction == 0:
+        ahead = behind = max(ahead, behind)
+        direction = 1
+    forward = [current + direction * i for i in range(1, ahead + 1)]
+    backward = [current - direction * i for i in range(1, behind + 1)]
+    order = []
+    for i in range(max(ahead, behind)):
+        for side in (forward, backward):
+            if i < len(side) and 0 <= side[i] < band_count:
+                order.append(side[i])
+    return order
+
+
+def write_display_cube(data, stats, stretch, path, progress=None, cancelled=None,
+                       chunk_bytes=CHUNK_BYTES):
+    """Quantize a whole cube to uint8 display frames in a (bands, cols, rows) .npy file.
+
+    Every band goes through its own transfer of a global stretch (derived
+    from the cached histograms) and is stored in display orientation
+    (rot90, k=-1), so display_cube[band] is a contiguous frame ready to show.
+    Row blocks are quantized for all bands at once, with the same arithmetic
+    as render_band. Returns the read-only memmap, or None if cancelled (the
+    partial file is removed).
+    """
+    rows, cols, bands = data.shape
+    low, high, luts = cube_transfers(stats, stretch)
+    band_index = np.arange(bands)
+
+    part_path = path[:-len(".npy")] + ".part.npy"
+    cube = np.lib.format.open_memmap(part_path, mode='w+', dtype=np.uint8, shape=(bands, cols, rows))
+    for row_start, row_end, block in iter_row_blocks(data, chunk_bytes):
+        if cancelled is not None and cancelled():
+            del cube
+            os.remove(part_path)
+            return None
+        frames = luts[band_index, lut_index(block, low, high)]
+        # Data row r lands in display column rows - 1 - r
+        cube[:, :, rows - row_end:rows - row_start] = np.transpose(frames[::-1], (2, 1, 0))
+        if progress is not None:
+            progress(row_end / float(rows))
+    cube.flush()
+    del cube
+    os.replace(part_path, path)
+    return np.load(path, mmap_mode='r')
+
+
+def stretch_bands(data, bands, stats=None):
+    """Read bands in display orientation and stretch them to an (H, W, len(bands)) uint8 image.
+
+    Each band is stretched between its 1st and 99th percentile, taken from
+    the cube statistics when given; all bands are scaled in one pass.
+    """
+    values = np.stack([display_band(data, band) for band in bands], axis=-1).astype(np.float32, copy=False)
+    if stats is not None:
+        low = np.asarray(stats["band_p1"], dtype=np.float64)[list(bands)]
+        high = np.asarray(stats["band_p99"], dtype=np.float64)[list(bands)]
+    else:
+        low, high = np.nanpercentile(values, (1, 99), axis=(0, 1))
+    width = high - low
+    scale = np.where(width > 0, 255.0 / np.where(width > 0, width, 1), 0).astype(np.float32)
+    scaled = (np.nan_to_num(values) - low.astype(np.float32)) * scale
+    np.clip(scaled, 0, 255, out=scaled)
+    return scaled.astype(np.uint8)
+
+
+def parse_band_list(text, band_count):
+    """Parse "3, 10, 20-22" into a list of band indices, keeping the given order.
+
+    Raises ValueError for malformed entries or bands outside the cube.
+    """
+    bands = []
+    for part in text.replace(";", ",").split(","):
+        part = part.strip()
+        if not part:
+            continue
+        if "-" in part[1:]:
+            first, last = (int(value) for value in part.split("-", 1))
+            bands.extend(range(first, last + 1) if first <= last else range(first, last - 1, -1))
+        else:
+            bands.append(int(part))
+    for band in bands:
+        if not 0 <= band < band_count:
+            raise ValueError(f"Band {band} is outside 0-{band_count - 1}")
+    if not bands:
+        raise ValueError("No bands given")
+    return bands
+
+
+def band_wavelengths(hdr_image):
+    """Return band centre wavelengths in nm, or None if the header has none."""
+    centers = getattr(getattr(hdr_image, "bands", None), "centers", None)
+    if not centers:
+        return None
+    wavelengths = np.asarray(centers, dtype=np.float64)
+    units = str(hdr_image.metadata.get("wavelength units", "")).lower()
+    if units.startswith(("micro", "um", "\u00b5m")) or (not units and wavelengths.max() < 100):
+        wavelengths = wavelengths * 1000.0
+    return wavelengths
+
+
+def preset_bands(wavelengths, preset):
+    """Return the bands nearest to a COMPOSITE_PRESETS entry's (red, green, blue) wavelengths."""
+    return tuple(int(np.argmin(np.abs(wavelengths - target))) for target in COMPOSITE_PRESETS[preset])
+
+
+class RGBComposite:
+    """False-colour composite of three bands, each channel stretched independently.
+
+    Changing one channel's band re-reads and re-stretches only that channel.
+    """
+    def __init__(self, data, stats=None):
+        self.data = data
+        self.stats = stats
+        self.bands = [None, None, None]
+        self.image = None
+
+    def set_bands(self, bands):
+        """Show bands (red, green, blue) and return the (H, W, 3) uint8 image."""
+        bands = [int(band) for band in bands]
+        if self.image is None:
+            changed = [0, 1, 2]
+        else:
+            changed = [channel for channel in range(3) if bands[channel] != self.bands[channel]]
+        if changed:
+            planes = stretch_bands(self.data, [bands[channel] for channel in changed], self.stats)
+            if self.image is None:
+                self.image = np.empty(planes.shape[:2] + (3,), dtype=np.uint8)
+            self.image[:, :, changed] = planes
+        self.bands = bands
+        return self.image
+
+
+def band_ratio(a, b, mode="difference", out=None):
+    """Return (a - b) / (a + b) for "difference" or a / b for "ratio".
+
+    Pixels where the result is undefined (zero denominator) are NaN.
+    """
+    if mode not in RATIO_MODES:
+        raise ValueError(f"Unknown band ratio: {mode}")
+    with np.errstate(divide="ignore", invalid="ignore"):
+        if mode == "difference":
+            out = np.subtract(a, b, out=out)
+            out /= a + b
+        else:
+            out = np.divide(a, b, out=out)
+    out[~np.isfinite(out)] = np.nan
+    return out
+
+
+def ratio_display_range(values, mode):
+    """Return the (low, high) value range a band ratio image is colormapped over.
+
+    Normalized differences use their full -1..1 range so colours compare
+    across band pairs; ratios are unbounded and use their 2-98% range.
+    """
+    if mode == "difference":
+        return -1.0, 1.0
+    hist, lo, hi = image_histogram(values)
+    low = histogram_percentile(hist, [lo], [hi], 2)[0]
+    high = histogram_percentile(hist, [lo], [hi], 98)[0]
+    return float(low), float(high)
+
+
+class BandRatio:
+    """Live ratio of two bands read as float32 operands in display orientation.
+
+    The operands of the last few bands are kept, so when only one of the two
+    bands changes only that band is read and the other's float data is
+    reused. Bands are read every step pixels, at the resolution on screen.
+    """
+    def __init__(self, data, step=1, keep=4):
+        self.data = data
+        self.step = step
+        self.keep = keep
+        self._operands = OrderedDict()
+        self._out = None
+
+    def operand(self, band):
+        """Return a band's float32 display image, reading it only if it is not kept."""
+        values = self._operands.get(band)
+        if values is None:
+            values = np.ascontiguousarray(display_band(self.data, band, self.step), dtype=np.float32)
+            self._operands[band] = values
+            while len(self._operands) > self.keep:
+                self._operands.popitem(last=False)
+        else:
+            self._operands.move_to_end(band)
+        return values
+
+    def compute(self, band_a, band_b, mode="difference"):
+        """Return the float32 ratio image of bands A and B (reused between calls)."""
+        a = self.operand(band_a)
+        b = self.operand(band_b)
+        if self._out is None or self._out.shape != a.shape:
+            self._out = np.empty(a.shape, dtype=np.float32)
+        return band_ratio(a, b, mode, out=self._out)
+
+
+def decimate2(image):
+    """Halve an image in both directions with a 2x2 box filter."""
+    height, width = image.shape[:2]
+    # Replicate the last row/column so odd sizes round up like a strided read
+    if height % 2:
+        image = np.concatenate([image, image[-1:]], axis=0)
+    if width % 2:
+        image = np.concatenate([image, image[:, -1:]], axis=1)
+    blocks = image.reshape(image.shape[0] // 2, 2, image.shape[1] // 2, 2, *image.shape[2:])
+    summed = blocks.sum(axis=(1, 3), dtype=np.uint32)
+    return ((summed + 2) // 4).astype(image.dtype)
+
+
+def choose_level(scale, max_level=MAX_LEVEL):
+    """Return the pyramid level whose resolution best matches a view scale.
+
+    scale is screen pixels per full-resolution image pixel; level k holds
+    the image decimated by 2**k.
+    """
+    if scale <= 0 or scale >= 1:
+        return 0
+    return max(0, min(max_level, int(math.floor(math.log2(1.0 / scale)))))
+
+
+class BandImageCache:
+    """LRU of rendered display levels keyed by (band, level), bounded by bytes."""
+    def __init__(self, max_bytes=BAND_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self._entries = OrderedDict()
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, band, level):
+        """Return a cached level and mark it most recently used, or None."""
+        image = self._entries.get((band, level))
+        if image is not None:
+            self._entries.move_to_end((band, level))
+        return image
+
+    def put(self, band, level, image):
+        """Store a level, evicting the least recently used ones over budget."""
+        key = (band, level)
+        if key in self._entries:
+            self.nbytes -= self._entries.pop(key).nbytes
+        self._entries[key] = image
+        self.nbytes += image.nbytes
+        while self.nbytes > self.max_bytes and len(self._entries) > 1:
+            _, evicted = self._entries.popitem(last=False)
+            self.nbytes -= evicted.nbytes
+
+    def finer_level(self, band, level):
+        """Return the coarsest cached level of band finer than level, or None."""
+        finer = [j for (b, j) in self._entries if b == band and j < level]
+        return max(finer) if finer else None
+
+    def clear(self):
+        self._entries.clear()
+        self.nbytes = 0
+
+
+class BandPyramid:
+    """2x-decimated display levels of one band, built lazily on request.
+
+    fetch(step) must return the display-ready uint8 band sampled every step
+    pixels. A level is derived from the nearest finer level that is already
+    cached, otherwise it is fetched directly at its own resolution so the
+    full-resolution band is never read just to show an overview. Levels are
+    kept in a BandImageCache shared by all bands.
+    """
+    def __init__(self, band_index, fetch, cache):
+        self.band_index = band_index
+        self.fetch = fetch
+        self.cache = cache
+
+    def level(self, k):
+        """Return the uint8 image of level k."""
+        image = self.cache.get(self.band_index, k)
+        if image is not None:
+            return image
+        j = self.cache.finer_level(self.band_index, k)
+        if j is not None:
+            image = self.cache.get(self.band_index, j)
+            for level in range(j + 1, k + 1):
+                image = decimate2(image)
+                self.cache.put(self.band_index, level, image)
+        else:
+            image = self.fetch(2 ** k)
+            self.cache.put(self.band_index, k, image)
+        return image
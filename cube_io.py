@@ -0,0 +1,386 @@
+import os
+import time
+import numpy as np
+import spectral
+import h5py
+
+# Raw data extensions that may accompany an ENVI header
+RAW_EXTENSIONS = ['.raw', '.RAW', '.bil', '.BIL', '.bsq', '.BSQ']
+
+# Cubes larger than this are memory-mapped instead of loaded into RAM
+MEMMAP_THRESHOLD_BYTES = 1024 * 1024 * 1024  # 1 GB
+
+# Amount of cube data processed per step by the chunked helpers
+CHUNK_BYTES = 64 * 1024 * 1024  # 64 MB
+
+# Size the application's temp_data directory is trimmed to, oldest-used files first
+TEMP_DATA_MAX_BYTES = 4 * 1024 * 1024 * 1024  # 4 GB
+
+# Slice selecting a whole axis
+ALL = slice(None)
+
+# HDF5 working cache: 64x64 pixel tiles of 16 bands serve both band slices
+# and pixel spectra, and neighbouring bands come from the same chunks
+H5_TILE = 64
+H5_BAND_GROUP = 16
+H5_CHUNK_CACHE_BYTES = 256 * 1024 * 1024
+
+
+class BandReader:
+    """Read single bands from an ENVI raw file following its interleave.
+
+    BSQ bands are contiguous blocks, BIL bands are gathered one row segment per
+    line in a single strided pass, and BIP bands can be served from an optional
+    band-major copy written with build_band_major_cache().
+    """
+    def __init__(self, hdr_image):
+        self.interleave = interleave_of(hdr_image)
+        # Memmap in the file's own layout: bsq (B, R, C), bil (R, B, C), bip (R, C, B)
+        self.source = hdr_image.open_memmap(interleave='source')
+        self.scale_factor = float(getattr(hdr_image, 'scale_factor', 1.0) or 1.0)
+        self.band_major = None  # (B, R, C) copy of a BIP cube, if built
+
+    def read_raw_band(self, band, rows=ALL, cols=ALL):
+        """Return a band (or a window/strided sample of it) as an unscaled view."""
+        if self.band_major is not None:
+            return self.band_major[band, rows, cols]
+        if self.interleave == 'bsq':
+            return self.source[band, rows, cols]
+        if self.interleave == 'bil':
+            return self.source[rows, band, cols]
+        return self.source[rows, cols, band]
+
+    def read_band(self, band, rows=ALL, cols=ALL):
+        """Return a band as a float32 (rows, cols) array."""
+        values = np.array(self.read_raw_band(band, rows, cols), dtype=np.float32)
+        if self.scale_factor != 1:
+            values /= np.float32(self.scale_factor)
+        return values
+
+    def build_band_major_cache(self, path, progress=None, cancelled=None, chunk_bytes=CHUNK_BYTES):
+        """Write a band-major copy of a BIP cube to path and read bands from it.
+
+        Returns False if cancelled, in which case the partial file is removed.
+        """
+        rows, cols, bands = self.source.shape
+        cache = np.lib.format.open_memmap(path, mode='w+', dtype=self.source.dtype,
+                                          shape=(bands, rows, cols))
+        rows_per_block = max(1, chunk_bytes // max(1, cols * bands * self.source.dtype.itemsize))
+        for row_start in range(0, rows, rows_per_block):
+            if cancelled is not None and cancelled():
+                del cache
+                os.remove(path)
+                return False
+            row_end = min(rows, row_start + rows_per_block)
+            cache[:, row_start:row_end, :] = np.transpose(self.source[row_start:row_end], (2, 0, 1))
+            if progress is not None:
+                progress(row_end / float(rows))
+        cache.flush()
+        del cache
+        self.band_major = np.load(path, mmap_mode='r')
+        return True
+
+
+class MemmapCube:
+    """Lazy (rows, cols, bands) view over the raw file of an ENVI cube.
+
+    Indexing reads only the requested region from disk and returns float32
+    values with the header's reflectance scale factor applied, matching what
+    spectral's load() would have produced for the same region.
+    """
+    def __init__(self, hdr_image):
+        self.image = hdr_image
+        self.memmap = hdr_image.open_memmap(interleave='bip')
+        self.reader = BandReader(hdr_image)
+        self.scale_factor = float(getattr(hdr_image, 'scale_factor', 1.0) or 1.0)
+        self.shape = tuple(self.memmap.shape)
+        self.dtype = np.dtype(np.float32)
+        self.ndim = 3
+
+    @property
+    def size(self):
+        return int(np.prod(self.shape))
+
+    def __getitem__(self, key):
+        values = np.asarray(self.memmap[key], dtype=np.float32)
+        if self.scale_factor != 1:
+            values = values / np.float32(self.scale_factor)
+        return values
+
+    def read_band(self, band, rows=ALL, cols=ALL):
+        """Return a float32 (rows, cols) band using the interleave-aware reader."""
+        return self.reader.read_band(band, rows, cols)
+
+    def __array__(self, dtype=None, copy=None):
+        # Materializes the whole cube; only used when a caller insists on it
+        values = self[:, :, :]
+        return values if dtype is None else values.astype(dtype)
+
+
+class MaskedCube:
+    """Lazy view of a cube where pixels outside a 2D mask read as zero.
+
+    Replaces building a full masked copy of the cube after segmentation; the
+    mask is applied only to the region that is actually indexed.
+    """
+    def __init__(self, data, mask):
+        # Plain ndarray view so band indexing drops the band axis as usual
+        self.data = data.view(np.ndarray) if isinstance(data, np.ndarray) else data
+        self.mask = np.asarray(mask, dtype=bool)
+        self.shape = tuple(data.shape)
+        self.dtype = np.dtype(data.dtype)
+        self.ndim = 3
+
+    @property
+    def size(self):
+        return int(np.prod(self.shape))
+
+    def __getitem__(self, key):
+        if not isinstance(key, tuple):
+            key = (key,)
+        values = np.asarray(self.data[key])
+        region_mask = self.mask[key[:2]]
+        # Broadcast the spatial mask over the band axis when it is kept
+        while region_mask.ndim < values.ndim:
+            region_mask = region_mask[..., np.newaxis]
+        return np.where(region_mask, values, 0).astype(values.dtype, copy=False)
+
+    def read_band(self, band, rows=ALL, cols=ALL):
+        """Return a (rows, cols) band with pixels outside the mask set to zero."""
+        values = read_band(self.data, band, rows, cols)
+        return np.where(self.mask[rows, cols], values, 0).astype(values.dtype, copy=False)
+
+    def __array__(self, dtype=None, copy=None):
+        values = self[:, :, :]
+        return values if dtype is None else values.astype(dtype)
+
+
+def interleave_of(hdr_image):
+    """Return the header's interleave as 'bsq', 'bil' or 'bip'."""
+    interleave = str(hdr_image.metadata.get('interleave', '')).strip().lower()
+    if interleave in ('bsq', 'bil', 'bip'):
+        return interleave
+    return {spectral.BSQ: 'bsq', spectral.BIL: 'bil', spectral.BIP: 'bip'}[hdr_image.interleave]
+
+
+def read_band(data, band, rows=ALL, cols=ALL):
+    """Return one band of any supported cube as a (rows, cols) array.
+
+    rows and cols are slices selecting a window of the band; a slice step
+    reads a decimated sample without touching the skipped pixels.
+    """
+    if isinstance(data, (MemmapCube, MaskedCube, H5Cube)):
+        return data.read_band(band, rows, cols)
+    # Plain ndarray indexing; spectral's ImageArray would keep a band axis
+    return np.asarray(data)[rows, cols, band]
+
+
+class H5Cube:
+    """Lazy (rows, cols, bands) view over an HDF5 working cache of a cube."""
+    def __init__(self, path):
+        self.path = path
+        self.file = h5py.File(path, 'r', rdcc_nbytes=H5_CHUNK_CACHE_BYTES, rdcc_nslots=100003)
+        self.dataset = self.file['cube']
+        self.scale_factor = float(self.dataset.attrs.get('scale_factor', 1.0))
+        self.shape = tuple(self.dataset.shape)
+        self.dtype = np.dtype(np.float32)
+        self.ndim = 3
+
+    @property
+    def size(self):
+        return int(np.prod(self.shape))
+
+    def __getitem__(self, key):
+        values = np.asarray(self.dataset[key], dtype=np.float32)
+        if self.scale_factor != 1:
+            values = values / np.float32(self.scale_factor)
+        return values
+
+    def read_band(self, band, rows=ALL, cols=ALL):
+        """Return a float32 (rows, cols) band."""
+        return self[rows, cols, band]
+
+    def __array__(self, dtype=None, copy=None):
+        values = self[:, :, :]
+        return values if dtype is None else values.astype(dtype)
+
+
+def h5_cache_path(hdr_path):
+    """Return the path of the HDF5 working cache stored next to a header."""
+    return os.path.splitext(hdr_path)[0] + ".cache.h5"
+
+
+def _raw_key(raw_path):
+    info = os.stat(raw_path)
+    return int(info.st_size), int(info.st_mtime_ns)
+
+
+def open_h5_cache(hdr_path, raw_path):
+    """Open the working cache of a cube, or return None if missing or stale."""
+    path = h5_cache_path(hdr_path)
+    if not os.path.exists(path):
+        return None
+    try:
+        cube = H5Cube(path)
+    except OSError:
+        return None
+    size, mtime = _raw_key(raw_path)
+    attrs = cube.dataset.attrs
+    if int(attrs.get('source_size', -1)) != size or int(attrs.get('source_mtime', -1)) != mtime:
+        cube.file.close()
+        return None
+    return cube
+
+
+def write_h5_cache(hdr_image, path, progress=None, cancelled=None):
+    """Write a cube to a chunked, LZF-compressed HDF5 working cache.
+
+    The raw values are stored unscaled in their native dtype. The file is
+    written under a temporary name and only moved into place when complete;
+    returns False if cancelled.
+    """
+    view = MemmapCube(hdr_image)
+    rows, cols, bands = view.shape
+    source = view.memmap
+    chunks = (min(rows, H5_TILE), min(cols, H5_TILE), min(bands, H5_BAND_GROUP))
+    size, mtime = _raw_key(hdr_image.filename)
+    temp_path = path + ".part"
+    completed = True
+    with h5py.File(temp_path, 'w') as f:
+        dataset = f.create_dataset('cube', shape=(rows, cols, bands), dtype=source.dtype.newbyteorder('='),
+                                   chunks=chunks, compression='lzf')
+        dataset.attrs['scale_factor'] = view.scale_factor
+        dataset.attrs['source_size'] = size
+        dataset.attrs['source_mtime'] = mtime
+        # Write whole rows of chunks at a time so every chunk is compressed once
+        for row_start in range(0, rows, chunks[0]):
+            if cancelled is not None and cancelled():
+                completed = False
+                break
+            row_end = min(rows, row_start + chunks[0])
+            dataset[row_start:row_end] = np.asarray(source[row_start:row_end])
+            if progress is not None:
+                progress(row_end / float(rows))
+    if not completed:
+        os.remove(temp_path)
+        return False
+    os.replace(temp_path, path)
+    return True
+
+
+def cube_nbytes(hdr_image):
+    """Return the size in bytes of the cube described by an opened header."""
+    rows, cols, bands = hdr_image.shape
+    return rows * cols * bands * np.dtype(hdr_image.dtype).itemsize
+
+
+def should_memmap(hdr_image, mode="auto", threshold=MEMMAP_THRESHOLD_BYTES):
+    """Decide whether a cube should be memory-mapped for the given load mode.
+
+    mode is "load", "memmap" or "auto"; "auto" memory-maps cubes larger than
+    threshold bytes.
+    """
+    return mode == "memmap" or (mode == "auto" and cube_nbytes(hdr_image) > threshold)
+
+
+def load_cube(view, progress=None, cancelled=None, chunk_bytes=CHUNK_BYTES):
+    """Copy a MemmapCube into RAM block by block.
+
+    progress(fraction) is called after each block and cancelled() is polled
+    between blocks; returns None if the load was cancelled.
+    """
+    rows, cols, bands = view.shape
+    data = np.empty((rows, cols, bands), dtype=np.float32)
+    for row_start, row_end, block in iter_row_blocks(view, chunk_bytes):
+        if cancelled is not None and cancelled():
+            return None
+        data[row_start:row_end] = block
+        if progress is not None:
+            progress(row_end / float(rows))
+    return data
+
+
+def is_memmapped(data):
+    """Return True if the cube data is read lazily from disk."""
+    return isinstance(data, (MemmapCube, H5Cube))
+
+
+def iter_row_blocks(data, chunk_bytes=CHUNK_BYTES, row_range=None):
+    """Yield (row_start, row_end, block) over the cube in float32 row blocks.
+
+    row_range=(first, stop) limits the pass to those rows.
+    """
+    rows, cols, bands = data.shape
+    first, stop = row_range if row_range is not None else (0, rows)
+    rows_per_block = max(1, chunk_bytes // max(1, cols * bands * 4))
+    for row_start in range(first, stop, rows_per_block):
+        row_end = min(stop, row_start + rows_per_block)
+        yield row_start, row_end, np.asarray(data[row_start:row_end, :, :], dtype=np.float32)
+
+
+def mean_spectrum(data, progress=None, cancelled=None, chunk_bytes=CHUNK_BYTES):
+    """Compute the full-image mean spectrum without materializing the cube.
+
+    progress(fraction) is called after each block and cancelled() is polled
+    between blocks; returns None if cancelled.
+    """
+    rows, cols, bands = data.shape
+    total = np.zeros(bands, dtype=np.float64)
+    for _, row_end, block in iter_row_blocks(data, chunk_bytes):
+        if cancelled is not None and cancelled():
+            return None
+        total += block.sum(axis=(0, 1), dtype=np.float64)
+        if progress is not None:
+            progress(row_end / float(rows))
+    return total / float(rows * cols)
+
+
+def touch_cache_file(path):
+    """Mark a cache file as just used, for prune_cache_dir.
+
+    Only the access time changes; the modification time some caches are
+    validated with is kept.
+    """
+    try:
+        os.utime(path, ns=(time.time_ns(), os.stat(path).st_mtime_ns))
+    except OSError:
+        pass
+
+
+def prune_cache_dir(directory, max_bytes, keep=(), suffix=".npy"):
+    """Delete the least recently used suffix files of a directory until they fit in max_bytes.
+
+    Files in keep (e.g. memory-mapped by the current cube) are never
+    deleted. Files that cannot be removed, such as ones still mapped on
+    Windows, are skipped. Returns the number of bytes freed.
+    """
+    keep = {os.path.abspath(path) for path in keep if path}
+    entries = []
+    try:
+        names = os.listdir(directory)
+    except OSError:
+        return 0
+    for name in names:
+        path = os.path.join(directory, name)
+        if not name.endswith(suffix):
+            continue
+        try:
+            info = os.stat(path)
+        except OSError:
+            continue
+        entries.append((info.st_atime_ns, info.st_size, path))
+
+    total = sum(size for _, size, _ in entries)
+    freed = 0
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        if os.path.abspath(path) in keep:
+            continue
+        try:
+            os.remove(path)
+        except OSError:
+            continue
+        total -= size
+        freed += size
+    return freed
@@ -0,0 +1,226 @@
+import os
+import numpy as np
+from cube_io import iter_row_blocks
+
+# Bump when the layout of the statistics sidecar changes
+STATS_VERSION = 2
+
+# Number of histogram bins kept per band
+HIST_BINS = 512
+
+# Smaller blocks than the loader because the pass keeps float64 temporaries
+STATS_CHUNK_BYTES = 16 * 1024 * 1024
+
+# A histogram whose core (0.5-99.5%) range spans fewer bins than this is
+# re-binned over that range, so a few extreme pixels do not squash the rest
+# of the band into one bin
+MIN_CORE_BINS = 64
+CORE_PERCENTILES = (0.5, 99.5)
+
+
+class StreamingBandStats:
+    """Accumulate per-band statistics over pixel blocks in a single pass.
+
+    Min/max, mean and std are exact. Histograms cover the running min/max
+    range of each band; when a block widens the range the existing counts are
+    re-binned into the new range, so no second pass over the cube is needed.
+    core_lo/core_hi track the widest per-block CORE_PERCENTILES range, which
+    brackets the bulk of each band even when outliers set min/max.
+    """
+    def __init__(self, bands, bins=HIST_BINS):
+        self.bands = bands
+        self.bins = bins
+        self.count = np.zeros(bands, dtype=np.int64)
+        self.total = np.zeros(bands, dtype=np.float64)
+        self.total_sq = np.zeros(bands, dtype=np.float64)
+        self.band_min = np.full(bands, np.inf)
+        self.band_max = np.full(bands, -np.inf)
+        self.hist = np.zeros((bands, bins), dtype=np.float64)
+        self.hist_lo = np.zeros(bands, dtype=np.float64)
+        self.hist_hi = np.zeros(bands, dtype=np.float64)
+        self.core_lo = np.full(bands, np.inf)
+        self.core_hi = np.full(bands, -np.inf)
+
+    def update(self, block):
+        """Add a (pixels, bands) block of values."""
+        block = np.asarray(block, dtype=np.float32).reshape(-1, self.bands)
+        valid = np.isfinite(block)
+        values = np.where(valid, block, 0).astype(np.float64)
+
+        self.count += valid.sum(axis=0)
+        self.total += values.sum(axis=0)
+        self.total_sq += np.square(values).sum(axis=0)
+        self.band_min = np.minimum(self.band_min, np.where(valid, block, np.inf).min(axis=0))
+        self.band_max = np.maximum(self.band_max, np.where(valid, block, -np.inf).max(axis=0))
+
+        # Widen the histogram range and move existing counts if needed
+        new_lo = np.where(np.isfinite(self.band_min), self.band_min, 0.0)
+        new_hi = np.where(np.isfinite(self.band_max), self.band_max, new_lo)
+        if np.any(new_lo != self.hist_lo) or np.any(new_hi != self.hist_hi):
+            self.hist = self._rebin(new_lo, new_hi)
+            self.hist_lo, self.hist_hi = new_lo, new_hi
+
+        self.hist += _block_histogram(block, valid, self.hist_lo, self.hist_hi, self.bins)
+
+        if valid.all():
+            core = np.percentile(block, CORE_PERCENTILES, axis=0)
+        else:
+            core = np.nanpercentile(np.where(valid, block, np.nan), CORE_PERCENTILES, axis=0)
+        self.core_lo = np.fmin(self.core_lo, core[0])
+        self.core_hi = np.fmax(self.core_hi, core[1])
+
+    def _rebin(self, new_lo, new_hi):
+        if not self.hist.any():
+            return self.hist
+        width = _safe_width(self.hist_lo, self.hist_hi)
+        centers = self.hist_lo[:, None] + (np.arange(self.bins) + 0.5)[None, :] * (width[:, None] / self.bins)
+        bin_index = _bin_index(centers.T, new_lo, new_hi, self.bins).T
+        flat = bin_index + (np.arange(self.bands) * self.bins)[:, None]
+        return np.bincount(flat.ravel(), weights=self.hist.ravel(),
+                           minlength=self.bands * self.bins).reshape(self.bands, self.bins)
+
+    def result(self):
+        """Return the statistics as a dict of arrays."""
+        count = np.maximum(self.count, 1)
+        mean = self.total / count
+        std = np.sqrt(np.maximum(self.total_sq / count - mean * mean, 0))
+        band_min = np.where(np.isfinite(self.band_min), self.band_min, 0.0)
+        band_max = np.where(np.isfinite(self.band_max), self.band_max, 0.0)
+        return {
+            "band_min": band_min,
+            "band_max": band_max,
+            "band_p1": histogram_percentile(self.hist, self.hist_lo, self.hist_hi, 1),
+            "band_p99": histogram_percentile(self.hist, self.hist_lo, self.hist_hi, 99),
+            "band_mean": mean,
+            "band_std": std,
+            "band_count": self.count,
+            "hist": self.hist,
+            "hist_lo": self.hist_lo,
+            "hist_hi": self.hist_hi,
+            # The mean of every band over all pixels is the full-image mean spectrum
+            "mean_spectrum": mean,
+        }
+
+
+def _block_histogram(block, valid, lo, hi, bins):
+    """Histogram (pixels, bands) values per band; values outside [lo, hi] land in the edge bins."""
+    bands = block.shape[1]
+    # One bincount covers every band: flat index = band * bins + bin
+    bin_index = _bin_index(block, lo, hi, bins)
+    flat = bin_index + np.arange(bands) * bins
+    return np.bincount(flat[valid], minlength=bands * bins).reshape(bands, bins)
+
+
+def is_coarse(lo, hi, core_lo, core_hi, bins):
+    """True where [core_lo, core_hi] spans fewer than MIN_CORE_BINS bins of [lo, hi]."""
+    return (np.isfinite(core_lo) & np.isfinite(core_hi) & (core_hi > core_lo)
+            & ((core_hi - core_lo) * bins < (hi - lo) * MIN_CORE_BINS))
+
+
+def _safe_width(lo, hi):
+    width = hi - lo
+    return np.where(width > 0, width, 1.0)
+
+
+def _bin_index(values, lo, hi, bins):
+    """Map (pixels, bands) values to histogram bins of each band's [lo, hi]."""
+    scaled = (values - lo) / _safe_width(lo, hi) * bins
+    scaled = np.nan_to_num(scaled, nan=0.0, posinf=bins - 1, neginf=0.0)
+    return np.clip(scaled.astype(np.int64), 0, bins - 1)
+
+
+def histogram_percentile(hist, lo, hi, q):
+    """Approximate the q-th percentile of each band from its histogram."""
+    hist = np.atleast_2d(hist)
+    bins = hist.shape[1]
+    cdf = np.cumsum(hist, axis=1)
+    target = cdf[:, -1] * (q / 100.0)
+    result = np.empty(hist.shape[0], dtype=np.float64)
+    for band in range(hist.shape[0]):
+        index = min(int(np.searchsorted(cdf[band], target[band])), bins - 1)
+        below = cdf[band, index - 1] if index > 0 else 0.0
+        in_bin = hist[band, index]
+        fraction = (target[band] - below) / in_bin if in_bin > 0 else 0.0
+        result[band] = lo[band] + (index + fraction) * (hi[band] - lo[band]) / bins
+    return result
+
+
+def compute_cube_stats(data, bins=HIST_BINS, progress=None, cancelled=None):
+    """Compute per-band statistics of a cube in one streaming pass.
+
+    A second pass is made only for bands whose histogram is too coarse
+    around the bulk of the data (see is_coarse); their histogram then
+    covers the core range, with the tails counted in the edge bins.
+    progress(fraction) is called after each block and cancelled() is polled
+    between blocks; returns None if cancelled.
+    """
+    rows, cols, bands = data.shape
+    accumulator = StreamingBandStats(bands, bins)
+    for _, row_end, block in iter_row_blocks(data, STATS_CHUNK_BYTES):
+        if cancelled is not None and cancelled():
+            return None
+        accumulator.update(block)
+        if progress is not None:
+            progress(row_end / float(rows))
+    result = accumulator.result()
+
+    # Outliers stretch the min/max range; re-bin such bands over their core range
+    coarse = is_coarse(result["hist_lo"], result["hist_hi"], accumulator.core_lo, accumulator.core_hi, bins)
+    if not np.any(coarse):
+        return result
+    core_lo = np.where(coarse, accumulator.core_lo, result["hist_lo"])
+    core_hi = np.where(coarse, accumulator.core_hi, result["hist_hi"])
+    refined = np.zeros((bands, bins), dtype=np.float64)
+    for _, row_end, block in iter_row_blocks(data, STATS_CHUNK_BYTES):
+        if cancelled is not None and cancelled():
+            return None
+        block = block.reshape(-1, bands)
+        refined += _block_histogram(block, np.isfinite(block), core_lo, core_hi, bins)
+        if progress is not None:
+            progress(row_end / float(rows))
+    result["hist"][coarse] = refined[coarse]
+    result["hist_lo"][coarse] = core_lo[coarse]
+    result["hist_hi"][coarse] = core_hi[coarse]
+    result["band_p1"] = histogram_percentile(result["hist"], result["hist_lo"], result["hist_hi"], 1)
+    result["band_p99"] = histogram_percentile(result["hist"], result["hist_lo"], result["hist_hi"], 99)
+    return result
+
+
+def stats_sidecar_path(hdr_path):
+    """Return the path of the statistics sidecar stored next to a header."""
+    return os.path.splitext(hdr_path)[0] + ".stats.npz"
+
+
+def _source_key(raw_path):
+    info = os.stat(raw_path)
+    return int(info.st_size), int(info.st_mtime_ns)
+
+
+def load_stats_sidecar(hdr_path, raw_path):
+    """Load cached statistics if the sidecar matches the raw file's size/mtime."""
+    path = stats_sidecar_path(hdr_path)
+    if not os.path.exists(path):
+        return None
+    try:
+        with np.load(path) as cached:
+            size, mtime = _source_key(raw_path)
+            if (int(cached["version"]) != STATS_VERSION or int(cached["source_size"]) != size
+                    or int(cached["source_mtime"]) != mtime):
+                return None
+            return {key: cached[key] for key in cached.files
+                    if key not in ("version", "source_size", "source_mtime")}
+    except Exception:
+        # Unreadable or partially written sidecar; recompute
+        return None
+
+
+def save_stats_sidecar(hdr_path, raw_path, stats):
+    """Write statistics next to the header; returns the path or None if not writable."""
+    path = stats_sidecar_path(hdr_path)
+    size, mtime = _source_key(raw_path)
+    try:
+        with open(path, "wb") as f:
+            np.savez(f, version=STATS_VERSION, source_size=size, source_mtime=mtime, **stats)
+        return path
+    except OSError:
+        return None
@@ -213,6 +213,10 @@ class FunctionInfoDialog(QtWidgets.QDialog):
                     <td><b>BACK:</b></td>
                     <td>Navigates back to the parent folder in the file browser.</td>
                 </tr>
+                <tr>
+                    <td><b>WORKING CACHE:</b></td>
+                    <td>Right-click a folder and choose "Convert to working cache" to write a compressed, chunked HDF5 copy of its cube. The copy is opened instead of the raw file for faster band and spectrum access.</td>
+                </tr>
             </table>
         </div>
 
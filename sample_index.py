@@ -0,0 +1,167 @@
+import os
+import sqlite3
+import time
+from spectral.io import envi
+from cube_io import RAW_EXTENSIONS
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS folders (
+    folder TEXT PRIMARY KEY,
+    indexed_at REAL
+);
+CREATE TABLE IF NOT EXISTS dirs (
+    folder TEXT,
+    dir TEXT,
+    mtime_ns INTEGER
+);
+CREATE TABLE IF NOT EXISTS files (
+    folder TEXT,
+    seq INTEGER,
+    kind TEXT,
+    path TEXT,
+    raw_path TEXT,
+    mtime_ns INTEGER,
+    rows INTEGER,
+    cols INTEGER,
+    bands INTEGER,
+    interleave TEXT,
+    dtype TEXT
+);
+CREATE INDEX IF NOT EXISTS dirs_folder ON dirs(folder);
+CREATE INDEX IF NOT EXISTS files_folder ON files(folder);
+"""
+
+FILE_COLUMNS = ("path", "raw_path", "mtime_ns", "rows", "cols", "bands", "interleave", "dtype")
+
+
+def header_info(hdr_path):
+    """Return (rows, cols, bands, interleave, dtype) from an ENVI header, None where unknown."""
+    try:
+        header = envi.read_envi_header(hdr_path)
+    except Exception:
+        return None, None, None, None, None
+
+    def as_int(key):
+        try:
+            return int(header[key])
+        except (KeyError, ValueError):
+            return None
+
+    dtype = envi.envi_to_dtype.get(str(header.get("data type", "")).strip())
+    interleave = header.get("interleave")
+    return (as_int("lines"), as_int("samples"), as_int("bands"),
+            interleave.strip().lower() if interleave else None, dtype)
+
+
+def _mtime_ns(path):
+    """Return the mtime of a path, or None if it cannot be stat'ed (e.g. a dangling symlink)."""
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+
+
+def scan_folder(folder):
+    """Walk a capture folder once and describe its PNG and HDR files.
+
+    Returns (dirs, files): the mtime of every directory in the tree, and one
+    row per PNG or HDR file in os.walk order. Headers without a raw file
+    next to them are skipped, as are entries that vanish or cannot be
+    stat'ed during the walk.
+    """
+    dirs = []
+    files = []
+    for root, _, names in os.walk(folder):
+        root_mtime = _mtime_ns(root)
+        if root_mtime is None:
+            continue
+        dirs.append((root, root_mtime))
+        present = set(names)
+        for name in names:
+            path = os.path.join(root, name)
+            lower = name.lower()
+            if not lower.endswith((".png", ".hdr")):
+                continue
+            mtime_ns = _mtime_ns(path)
+            if mtime_ns is None:
+                continue
+            if lower.endswith(".png"):
+                files.append(("png", path, None, mtime_ns, None, None, None, None, None))
+            else:
+                base = os.path.splitext(name)[0]
+                raw_name = next((base + ext for ext in RAW_EXTENSIONS if base + ext in present), None)
+                if raw_name is None:
+                    continue
+                files.append(("hdr", path, os.path.join(root, raw_name), mtime_ns) + header_info(path))
+    return dirs, files
+
+
+class SampleIndex:
+    """Persistent SQLite index of the PNG and HDR files in capture folders.
+
+    A folder is walked once and then served from the index. Before an entry
+    is returned, the recorded directory and file mtimes are re-checked; if
+    anything in the folder changed, only that folder is walked again.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.connection = sqlite3.connect(path)
+        self.connection.executescript(SCHEMA)
+
+    def close(self):
+        self.connection.close()
+
+    def get(self, folder):
+        """Return the index entry of a folder, walking it if it is new or changed.
+
+        The entry is a dict with "png_files" (paths) and "hdr_files" (dicts
+        with path, raw_path, mtime_ns, rows, cols, bands, interleave, dtype).
+        """
+        folder = os.path.normpath(folder)
+        if not self.is_current(folder):
+            self.refresh(folder)
+        return self.lookup(folder)
+
+    def lookup(self, folder):
+        """Return the stored entry of a folder without checking it, or None."""
+        folder = os.path.normpath(folder)
+        cursor = self.connection.execute("SELECT 1 FROM folders WHERE folder = ?", (folder,))
+        if cursor.fetchone() is None:
+            return None
+        rows = self.connection.execute(
+            "SELECT kind, " + ", ".join(FILE_COLUMNS) + " FROM files WHERE folder = ? ORDER BY seq",
+            (folder,)).fetchall()
+        return {
+            "png_files": [row[1] for row in rows if row[0] == "png"],
+            "hdr_files": [dict(zip(FILE_COLUMNS, row[1:])) for row in rows if row[0] == "hdr"],
+        }
+
+    def is_current(self, folder):
+        """Check a folder's recorded directory and file mtimes against the disk."""
+        cursor = self.connection.execute("SELECT 1 FROM folders WHERE folder = ?", (folder,))
+        if cursor.fetchone() is None:
+            return False
+        recorded = self.connection.execute(
+            "SELECT dir, mtime_ns FROM dirs WHERE folder = ? "
+            "UNION ALL SELECT path, mtime_ns FROM files WHERE folder = ?", (folder, folder))
+        try:
+            return all(os.stat(path).st_mtime_ns == mtime_ns for path, mtime_ns in recorded)
+        except OSError:
+            return False
+
+    def refresh(self, folder):
+        """Walk a folder and replace its entry in the index."""
+        folder = os.path.normpath(folder)
+        dirs, files = scan_folder(folder)
+        with self.connection:
+            self.forget(folder)
+            self.connection.execute("INSERT INTO folders VALUES (?, ?)", (folder, time.time()))
+            self.connection.executemany("INSERT INTO dirs VALUES (?, ?, ?)",
+                                        [(folder, path, mtime_ns) for path, mtime_ns in dirs])
+            self.connection.executemany("INSERT INTO files VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                                        [(folder, seq) + row for seq, row in enumerate(files)])
+
+    def forget(self, folder):
+        """Remove a folder from the index."""
+        for table in ("folders", "dirs", "files"):
+            self.connection.execute(f"DELETE FROM {table} WHERE folder = ?", (folder,))
@@ -0,0 +1,115 @@
+import numpy as np
+from cube_io import CHUNK_BYTES, iter_row_blocks
+from cube_stats import HIST_BINS, histogram_percentile
+
+def _labelled_pixels(data, labels, chunk_bytes):
+    """Yield (objects, values) for the labelled pixels, block by block.
+
+    objects holds the 0-based object index of each pixel and values its
+    (pixels, bands) spectrum; only the rows holding labelled pixels are read.
+    """
+    bands = data.shape[2]
+    labelled_rows = np.flatnonzero(np.any(labels > 0, axis=1))
+    if not labelled_rows.size:
+        return
+    row_range = (int(labelled_rows[0]), int(labelled_rows[-1]) + 1)
+    for row_start, row_end, block in iter_row_blocks(data, chunk_bytes, row_range):
+        block_labels = labels[row_start:row_end].reshape(-1)
+        inside = block_labels > 0
+        if not inside.any():
+            continue
+        yield block_labels[inside].astype(np.int64) - 1, block.reshape(-1, bands)[inside]
+
+
+def _flat_index(objects, bands):
+    """Index of each (pixel, band) value in a flattened (objects, bands) array."""
+    return objects[:, None] * bands + np.arange(bands)
+
+
+def label_band_moments(data, labels, count, cancelled=None, chunk_bytes=CHUNK_BYTES):
+    """Per-object, per-band pixel count, mean, std, min and max in one pass over the cube.
+
+    labels is a (rows, cols) integer image in data orientation, with 0 for
+    background and 1..count for the objects. Each row block is reduced for
+    all objects and bands at once: sums with bincount, and min/max with
+    reduceat over the pixels sorted by object. The cost is one sweep of the
+    labelled rows whatever the number of objects. Non-finite values are
+    skipped. Returns a dict of (count, bands) arrays, with NaN statistics
+    for an (object, band) without values, or None if cancelled.
+    """
+    bands = data.shape[2]
+    size = count * bands
+    n = np.zeros(size, dtype=np.int64)
+    total = np.zeros(size, dtype=np.float64)
+    total_sq = np.zeros(size, dtype=np.float64)
+    low = np.full((count, bands), np.inf)
+    high = np.full((count, bands), -np.inf)
+    for objects, values in _labelled_pixels(data, labels, chunk_bytes):
+        if cancelled is not None and cancelled():
+            return None
+        valid = np.isfinite(values)
+        flat = _flat_index(objects, bands)[valid]
+        finite = values[valid].astype(np.float64)
+        n += np.bincount(flat, minlength=size)
+        total += np.bincount(flat, weights=finite, minlength=size)
+        total_sq += np.bincount(flat, weights=finite * finite, minlength=size)
+
+        # Pixels grouped by object; reduceat gives each group's per-band min/max
+        order = np.argsort(objects, kind="stable")
+        grouped = objects[order]
+        starts = np.flatnonzero(np.r_[True, grouped[1:] != grouped[:-1]])
+        present = grouped[starts]
+        grouped_valid = valid[order]
+        grouped_values = values[order]
+        low[present] = np.minimum(low[present], np.minimum.reduceat(
+            np.where(grouped_valid, grouped_values, np.inf), starts))
+        high[present] = np.maximum(high[present], np.maximum.reduceat(
+            np.where(grouped_valid, grouped_values, -np.inf), starts))
+
+    empty = (n == 0).reshape(count, bands)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean = total / n
+        std = np.sqrt(np.maximum(total_sq / n - mean * mean, 0))
+    low[empty] = np.nan
+    high[empty] = np.nan
+    return {
+        "count": n.reshape(count, bands),
+        "mean": mean.reshape(count, bands),
+        "std": std.reshape(count, bands),
+        "min": low,
+        "max": high,
+    }
+
+
+def label_band_quantiles(data, labels, moments, bins=HIST_BINS, cancelled=None, chunk_bytes=CHUNK_BYTES):
+    """Approximate per-object, per-band 5th, 50th and 95th percentiles in one more pass.
+
+    Every (object, band) gets a histogram over its own min/max range from
+    label_band_moments, filled with a single bincount per block, and the
+    percentiles are read from it, so no object's pixels are ever sorted or
+    held at once. Returns a dict of (count, bands) arrays "p5", "median"
+    and "p95", NaN where there are no values, or None if cancelled.
+    """
+    shape = moments["count"].shape
+    size = shape[0] * shape[1]
+    low = np.nan_to_num(moments["min"].reshape(-1))
+    high = np.nan_to_num(moments["max"].reshape(-1))
+    scale = np.where(high > low, bins / np.where(high > low, high - low, 1.0), 0.0)
+    hist = np.zeros(size * bins, dtype=np.float64)
+    for objects, values in _labelled_pixels(data, labels, chunk_bytes):
+        if cancelled is not None and cancelled():
+            return None
+        valid = np.isfinite(values)
+        flat = _flat_index(objects, shape[1])[valid]
+        values = values[valid]
+        bin_index = np.clip(((values - low[flat]) * scale[flat]).astype(np.int64), 0, bins - 1)
+        hist += np.bincount(flat * bins + bin_index, minlength=hist.size)
+    hist = hist.reshape(size, bins)
+
+    empty = moments["count"] == 0
+    result = {}
+    for name, q in (("p5", 5), ("median", 50), ("p95", 95)):
+        values = histogram_percentile(hist, low, high, q).reshape(shape)
+        values[empty] = np.nan
+        result[name] = values
+    return result
@@ -0,0 +1,176 @@
+import numpy as np
+import cv2
+from matplotlib import colormaps
+from cube_stats import HIST_BINS, histogram_percentile, is_coarse
+
+# Stretch modes offered in the band view, in menu order
+STRETCH_MODES = ("minmax", "percentile", "gamma", "equalize", "clahe")
+
+# Resolution of the transfer look-up tables between a band's low and high value
+LUT_LEVELS = 4096
+
+
+class Stretch:
+    """Display stretch settings.
+
+    minmax maps the full value range linearly; percentile clips to the
+    low/high percentiles; gamma applies t ** gamma after the percentile clip
+    (gamma < 1 brightens); equalize flattens the histogram; clahe is the
+    percentile stretch followed by contrast-limited adaptive equalization.
+    """
+    def __init__(self, mode="percentile", low=1.0, high=99.0, gamma=0.6, clip_limit=3.0):
+        if mode not in STRETCH_MODES:
+            raise ValueError(f"Unknown stretch mode: {mode}")
+        self.mode = mode
+        self.low = low
+        self.high = high
+        self.gamma = gamma
+        self.clip_limit = clip_limit
+
+    def key(self):
+        """Return a hashable description, for cache keys."""
+        return (self.mode, self.low, self.high, self.gamma, self.clip_limit)
+
+    @property
+    def is_global(self):
+        """True when every pixel maps through the same per-band transfer (no CLAHE)."""
+        return self.mode != "clahe"
+
+
+def image_histogram(image, mask=None, bins=HIST_BINS, max_refinements=3):
+    """Return (hist, lo, hi) of the finite values of image, or of image[mask].
+
+    Like the cube statistics, a histogram whose bulk falls into a handful of
+    bins (a few extreme pixels) is re-binned over the range holding the
+    bulk, with the tails counted in the edge bins.
+    """
+    values = np.asarray(image)
+    values = values[mask] if mask is not None else values.ravel()
+    values = values[np.isfinite(values)]
+    if values.size == 0:
+        return np.zeros(bins), 0.0, 0.0
+    lo, hi = float(values.min()), float(values.max())
+    hist, _ = np.histogram(values, bins=bins, range=(lo, hi if hi > lo else lo + 1.0))
+    for _ in range(max_refinements):
+        # Bin edges around the 0.5-99.5% counts
+        cdf = np.cumsum(hist)
+        first = int(np.argmax(cdf > cdf[-1] * 0.005))
+        last = int(np.argmax(cdf >= cdf[-1] * 0.995))
+        bin_width = (hi - lo) / bins
+        core_lo, core_hi = lo + first * bin_width, lo + (last + 1) * bin_width
+        if not is_coarse(lo, hi, core_lo, core_hi, bins):
+            break
+        lo, hi = core_lo, core_hi
+        hist, _ = np.histogram(np.clip(values, lo, hi), bins=bins, range=(lo, hi))
+    return hist.astype(np.float64), lo, hi
+
+
+def transfer(hist, lo, hi, stretch, value_range=None):
+    """Derive (low, high, lut) of one band from its histogram.
+
+    Values are clipped to [low, high], quantized to LUT_LEVELS steps and
+    mapped through lut (uint8). Only the histogram is used, never the pixels.
+    value_range is the band's true (min, max) for the minmax mode when the
+    histogram covers a narrower core range.
+    """
+    if stretch.mode == "minmax" and value_range is not None:
+        low, high = (float(value) for value in value_range)
+    elif stretch.mode in ("minmax", "equalize"):
+        low, high = float(lo), float(hi)
+    else:
+        low = float(histogram_percentile(hist, [lo], [hi], stretch.low)[0])
+        high = float(histogram_percentile(hist, [lo], [hi], stretch.high)[0])
+
+    t = np.linspace(0.0, 1.0, LUT_LEVELS)
+    if stretch.mode == "gamma":
+        curve = t ** stretch.gamma
+    elif stretch.mode == "equalize":
+        cdf = np.cumsum(hist, dtype=np.float64)
+        total = cdf[-1] if cdf[-1] > 0 else 1.0
+        curve = cdf[np.minimum((t * len(hist)).astype(np.int64), len(hist) - 1)] / total
+    else:
+        curve = t
+    return low, high, np.round(curve * 255.0).astype(np.uint8)
+
+
+def band_transfer(stats, band, stretch):
+    """Return (low, high, lut) of a cube band from its cached statistics histogram."""
+    return transfer(stats["hist"][band], stats["hist_lo"][band], stats["hist_hi"][band], stretch,
+                    value_range=(stats["band_min"][band], stats["band_max"][band]))
+
+
+def cube_transfers(stats, stretch):
+    """Return per-band (low, high, lut) arrays for every band of a cube."""
+    transfers = [band_transfer(stats, band, stretch) for band in range(len(stats["hist"]))]
+    low = np.array([t[0] for t in transfers])
+    high = np.array([t[1] for t in transfers])
+    return low, high, np.stack([t[2] for t in transfers])
+
+
+def lut_index(values, low, high):
+    """Quantize values to LUT indices; low/high broadcast over the last axis.
+
+    NaNs map to index 0. The arithmetic is float32 so that per-band and
+    whole-cube rendering produce identical frames.
+    """
+    low = np.asarray(low, dtype=np.float64)
+    width = np.asarray(high, dtype=np.float64) - low
+    scale = np.where(width > 0, (LUT_LEVELS - 1) / np.where(width > 0, width, 1), 0).astype(np.float32)
+    scaled = (np.nan_to_num(np.asarray(values, dtype=np.float32)) - low.astype(np.float32)) * scale
+    np.clip(scaled, 0, LUT_LEVELS - 1, out=scaled)
+    return scaled.astype(np.int32)
+
+
+def apply_transfer(values, low, high, lut, out=None):
+    """Map values through a band transfer to uint8."""
+    index = lut_index(values, low, high)
+    if out is None:
+        return lut[index]
+    return np.take(lut, index, out=out)
+
+
+def apply_local(image, stretch):
+    """Apply the adaptive (CLAHE) part of a stretch to a uint8 image, if any."""
+    if stretch.mode != "clahe":
+        return image
+    clahe = cv2.createCLAHE(clipLimit=stretch.clip_limit, tileGridSize=(8, 8))
+    return clahe.apply(np.ascontiguousarray(image))
+
+
+def stretch_image(image, stretch, mask=None, out=None):
+    """Stretch a single image using its own histogram.
+
+    With a mask, the histogram covers the masked pixels only and pixels
+    outside the mask are set to 0, as for segmented bands.
+    """
+    hist, lo, hi = image_histogram(image, mask)
+    if stretch.mode == "minmax":
+        values = np.asarray(image)[mask] if mask is not None else np.asarray(image)
+        finite = values[np.isfinite(values)]
+        value_range = (finite.min(), finite.max()) if finite.size else (0.0, 0.0)
+    else:
+        value_range = None
+    low, high, lut = transfer(hist, lo, hi, stretch, value_range)
+    result = apply_local(apply_transfer(image, low, high, lut, out=out), stretch)
+    if mask is not None:
+        result[~mask] = 0
+    return result
+
+
+def colormap_lut(name):
+    """Return a matplotlib colormap as a (256, 3) uint8 RGB look-up table."""
+    return np.round(colormaps[name](np.linspace(0.0, 1.0, 256))[:, :3] * 255.0).astype(np.uint8)
+
+
+def apply_colormap(values, low, high, lut, out=None):
+    """Map values linearly from [low, high] onto a colormap LUT as an (H, W, 3) uint8 image.
+
+    Non-finite values are drawn black.
+    """
+    values = np.asarray(values, dtype=np.float32)
+    scale = np.float32(255.0 / (high - low)) if high > low else np.float32(0.0)
+    scaled = (np.nan_to_num(values) - np.float32(low)) * scale
+    np.clip(scaled, 0, 255, out=scaled)
+    image = np.take(lut, scaled.astype(np.uint8), axis=0, out=out)
+    image[~np.isfinite(values)] = 0
+    return image
@@ -0,0 +1,71 @@
+import os
+import hashlib
+import numpy as np
+import cv2
+import spectral
+from cube_io import MemmapCube, touch_cache_file
+from band_view import display_band, to_uint8
+
+# Longest side of a stored thumbnail in pixels
+THUMBNAIL_SIZE = 96
+
+# Size limit of the thumbnail cache; least recently used thumbnails go first
+THUMBNAIL_CACHE_MAX_BYTES = 64 * 1024 * 1024
+
+
+def thumbnail_source(entry):
+    """Pick the file a sample index entry's thumbnail is made from: the RGB PNG, else the cube."""
+    if entry["png_files"]:
+        return entry["png_files"][0]
+    if entry["hdr_files"]:
+        return entry["hdr_files"][0]["path"]
+    return None
+
+
+def thumbnail_path(cache_dir, source):
+    """Return the cache file of a source, keyed by its path and mtime."""
+    key = f"{os.path.abspath(source)}|{os.stat(source).st_mtime_ns}"
+    return os.path.join(cache_dir, hashlib.sha1(key.encode("utf-8")).hexdigest() + ".png")
+
+
+def fit_size(height, width, size):
+    scale = size / float(max(height, width))
+    return max(1, int(round(width * scale))), max(1, int(round(height * scale)))
+
+
+def render_png_thumbnail(path, size=THUMBNAIL_SIZE):
+    image = cv2.imread(path, cv2.IMREAD_COLOR)
+    if image is None:
+        return None
+    return cv2.resize(image, fit_size(image.shape[0], image.shape[1], size), interpolation=cv2.INTER_AREA)
+
+
+def render_cube_thumbnail(hdr_path, size=THUMBNAIL_SIZE):
+    """Render the middle band of a cube from a strided read of about size pixels."""
+    view = MemmapCube(spectral.open_image(hdr_path))
+    rows, cols, bands = view.shape
+    step = max(1, max(rows, cols) // size)
+    band = np.nan_to_num(display_band(view, bands // 2, step))
+    low, high = np.percentile(band, (1, 99))
+    image = to_uint8(band, low, high)
+    return cv2.resize(image, fit_size(image.shape[0], image.shape[1], size), interpolation=cv2.INTER_AREA)
+
+
+def cached_thumbnail(source, cache_dir, size=THUMBNAIL_SIZE):
+    """Return the path of source's thumbnail, rendering it into cache_dir if needed."""
+    path = thumbnail_path(cache_dir, source)
+    if os.path.exists(path):
+        touch_cache_file(path)
+        return path
+    if source.lower().endswith(".png"):
+        image = render_png_thumbnail(source, size)
+    else:
+        image = render_cube_thumbnail(source, size)
+    if image is None:
+        return None
+    # Write under a temporary name so a reader never sees a partial file
+    part_path = path[:-len(".png")] + ".part.png"
+    if not cv2.imwrite(part_path, image):
+        return None
+    os.replace(part_path, path)
+    return path
@@ -0,0 +1,389 @@
+import os
+import hashlib
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import numpy as np
+import spectral
+from PyQt5 import QtCore
+from cube_io import MemmapCube, should_memmap, load_cube, mean_spectrum, open_h5_cache, prune_cache_dir, touch_cache_file, write_h5_cache
+from cube_stats import compute_cube_stats, load_stats_sidecar, save_stats_sidecar
+from band_view import render_band, write_display_cube
+from sample_index import SampleIndex
+from spectra import label_band_moments, label_band_quantiles
+from thumbnails import THUMBNAIL_CACHE_MAX_BYTES, cached_thumbnail, thumbnail_source
+
+
+class CancellableWorker(QtCore.QThread):
+    """Background thread that stops at its next checkpoint once cancelled.
+
+    run() polls is_cancelled() (or passes it as a cancelled callback) and
+    returns without emitting a result.
+    """
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self._cancelled = False
+
+    def cancel(self):
+        """Ask the worker to stop at its next checkpoint."""
+        self._cancelled = True
+
+    def is_cancelled(self):
+        return self._cancelled
+
+
+class CubeLoader(CancellableWorker):
+    """Load an ENVI cube off the GUI thread with progress and cancellation.
+
+    An up-to-date HDF5 working cache next to the header is opened lazily in
+    place of the raw file. When band_cache_dir is given and the cube is a
+    memory-mapped BIP file, the loader keeps running after `loaded` to write a
+    band-major copy there.
+    """
+    progress = QtCore.pyqtSignal(int, str)  # percent, stage description
+    first_band_ready = QtCore.pyqtSignal(object)  # 2D band in data orientation
+    loaded = QtCore.pyqtSignal(object, object)  # spectral image, cube data
+    failed = QtCore.pyqtSignal(str)
+    band_cache_ready = QtCore.pyqtSignal()
+
+    def __init__(self, hdr_path, mode="auto", band_cache_dir=None, use_working_cache=True, parent=None):
+        super().__init__(parent)
+        self.hdr_path = hdr_path
+        self.mode = mode
+        self.band_cache_dir = band_cache_dir
+        self.use_working_cache = use_working_cache
+
+    def run(self):
+        try:
+            hdr_image = spectral.open_image(self.hdr_path)
+            if self._cancelled:
+                return
+
+            # Prefer the chunked HDF5 working cache when one exists for this cube
+            if self.use_working_cache:
+                cached = open_h5_cache(self.hdr_path, hdr_image.filename)
+                if cached is not None:
+                    self.progress.emit(0, "opening working cache")
+                    self.first_band_ready.emit(cached.read_band(0))
+                    self.progress.emit(100, "done")
+                    self.loaded.emit(hdr_image, cached)
+                    return
+
+            # The memory-mapped view gives us the first band without a full read
+            view = MemmapCube(hdr_image)
+            self.progress.emit(0, "reading first band")
+            self.first_band_ready.emit(view.read_band(0))
+            if self._cancelled:
+                return
+
+            if should_memmap(hdr_image, self.mode):
+                data = view
+            else:
+                data = load_cube(
+                    view,
+                    progress=lambda fraction: self.progress.emit(int(fraction * 100), "loading cube"),
+                    cancelled=self.is_cancelled,
+                )
+            if data is None or self._cancelled:
+                return
+            self.progress.emit(100, "done")
+            self.loaded.emit(hdr_image, data)
+
+            if data is view and view.reader.interleave == 'bip' and self.band_cache_dir:
+                self.build_band_cache(view)
+        except FileNotFoundError:
+            self.failed.emit("HDR file not found")
+        except Exception as e:
+            self.failed.emit(str(e))
+
+    def build_band_cache(self, view):
+        """Write the band-major copy of a BIP cube used for fast band reads."""
+        os.makedirs(self.band_cache_dir, exist_ok=True)
+        key = hashlib.sha1(os.path.abspath(self.hdr_path).encode("utf-8")).hexdigest()[:16]
+        cache_path = os.path.join(self.band_cache_dir, f"bandmajor_{key}.npy")
+
+        # Reuse a copy written earlier in this session for the same cube
+        if os.path.exists(cache_path):
+            rows, cols, bands = view.shape
+            cached = np.load(cache_path, mmap_mode='r')
+            if cached.shape == (bands, rows, cols):
+                touch_cache_file(cache_path)
+                view.reader.band_major = cached
+                self.band_cache_ready.emit()
+                return
+            del cached
+
+        built = view.reader.build_band_major_cache(
+            cache_path,
+            progress=lambda fraction: self.progress.emit(int(fraction * 100), "building band cache"),
+            cancelled=self.is_cancelled,
+        )
+        if built:
+            self.band_cache_ready.emit()
+
+
+class StatsWorker(CancellableWorker):
+    """Load per-cube statistics from the sidecar or compute them in one pass."""
+    progress = QtCore.pyqtSignal(int)
+    ready = QtCore.pyqtSignal(object, bool)  # statistics dict, loaded from sidecar
+    failed = QtCore.pyqtSignal(str)
+
+    def __init__(self, hdr_path, raw_path, data, parent=None):
+        super().__init__(parent)
+        self.hdr_path = hdr_path
+        self.raw_path = raw_path
+        self.data = data
+
+    def run(self):
+        try:
+            stats = load_stats_sidecar(self.hdr_path, self.raw_path)
+            if stats is not None:
+                self.ready.emit(stats, True)
+                return
+
+            stats = compute_cube_stats(
+                self.data,
+                progress=lambda fraction: self.progress.emit(int(fraction * 100)),
+                cancelled=self.is_cancelled,
+            )
+            if stats is None:
+                return
+            save_stats_sidecar(self.hdr_path, self.raw_path, stats)
+            self.ready.emit(stats, False)
+        except Exception as e:
+            self.failed.emit(str(e))
+
+
+class SpectrumWorker(CancellableWorker):
+    """Average a cube into its full-image mean spectrum when no statistics are available."""
+    progress = QtCore.pyqtSignal(int)
+    ready = QtCore.pyqtSignal(object)  # (bands,) float64 mean spectrum
+    failed = QtCore.pyqtSignal(str)
+
+    def __init__(self, data, parent=None):
+        super().__init__(parent)
+        self.data = data
+
+    def run(self):
+        try:
+            spectrum = mean_spectrum(
+                self.data,
+                progress=lambda fraction: self.progress.emit(int(fraction * 100)),
+                cancelled=self.is_cancelled,
+            )
+            if spectrum is not None:
+                self.ready.emit(spectrum)
+        except Exception as e:
+            self.failed.emit(str(e))
+
+
+class ObjectStatsWorker(CancellableWorker):
+    """Reduce the segmented objects of a cube to per-band statistics.
+
+    Without moments, the moments pass runs first; with quantiles, the
+    percentile pass follows (reusing moments when given).
+    """
+    ready = QtCore.pyqtSignal(object)  # statistics dict of (objects, bands) arrays
+    failed = QtCore.pyqtSignal(str)
+
+    def __init__(self, data, labels, count, moments=None, quantiles=False, parent=None):
+        super().__init__(parent)
+        self.data = data
+        self.labels = labels
+        self.count = count
+        self.moments = moments
+        self.quantiles = quantiles
+
+    def run(self):
+        try:
+            stats = self.moments
+            if stats is None:
+                stats = label_band_moments(self.data, self.labels, self.count, cancelled=self.is_cancelled)
+                if stats is None:
+                    return
+            stats = dict(stats)
+            if self.quantiles:
+                quantiles = label_band_quantiles(self.data, self.labels, stats, cancelled=self.is_cancelled)
+                if quantiles is None:
+                    return
+                stats.update(quantiles)
+            self.ready.emit(stats)
+        except Exception as e:
+            self.failed.emit(str(e))
+
+
+class WorkingCacheWriter(CancellableWorker):
+    """Convert a capture's ENVI cube into an HDF5 working cache; cancelling removes the partial file."""
+    progress = QtCore.pyqtSignal(int)
+    done = QtCore.pyqtSignal(str)  # path of the written cache
+    failed = QtCore.pyqtSignal(str)
+
+    def __init__(self, hdr_path, cache_path, parent=None):
+        super().__init__(parent)
+        self.hdr_path = hdr_path
+        self.cache_path = cache_path
+
+    def run(self):
+        try:
+            hdr_image = spectral.open_image(self.hdr_path)
+            written = write_h5_cache(
+                hdr_image,
+                self.cache_path,
+                progress=lambda fraction: self.progress.emit(int(fraction * 100)),
+                cancelled=self.is_cancelled,
+            )
+            if written:
+                self.done.emit(self.cache_path)
+        except Exception as e:
+            self.failed.emit(str(e))
+
+
+class BandPrefetcher(CancellableWorker):
+    """Render display levels of the bands around the slider ahead of the user.
+
+    The cube and statistics are captured at construction, so results stay
+    consistent even if the GUI swaps cubes while the thread runs.
+    """
+    band_ready = QtCore.pyqtSignal(int, int, object)  # band, pyramid level, uint8 image
+    failed = QtCore.pyqtSignal(str)
+
+    def __init__(self, data, bands, level, stats=None, stretch=None, parent=None):
+        super().__init__(parent)
+        self.data = data
+        self.bands = list(bands)
+        self.level = level
+        self.stats = stats
+        self.stretch = stretch
+
+    def run(self):
+        try:
+            for band in self.bands:
+                if self._cancelled:
+                    return
+                image = render_band(self.data, band, 2 ** self.level, self.stats, self.stretch)
+                self.band_ready.emit(band, self.level, image)
+        except Exception as e:
+            self.failed.emit(str(e))
+
+
+class FolderLister(CancellableWorker):
+    """List the subfolders of a directory with os.scandir, streaming batches."""
+    batch_ready = QtCore.pyqtSignal(object)  # list of (name, mtime)
+    listed = QtCore.pyqtSignal(str, object, object)  # folder, folder mtime_ns, all (name, mtime)
+    failed = QtCore.pyqtSignal(str)
+
+    def __init__(self, folder, batch_size=256, parent=None):
+        super().__init__(parent)
+        self.folder = folder
+        self.batch_size = batch_size
+
+    def run(self):
+        try:
+            # Taken before the scan so a change made during it invalidates the listing
+            folder_mtime = os.stat(self.folder).st_mtime_ns
+            entries = []
+            batch = []
+            with os.scandir(self.folder) as it:
+                for entry in it:
+                    if self._cancelled:
+                        return
+                    try:
+                        if not entry.is_dir():
+                            continue
+                        batch.append((entry.name, entry.stat().st_mtime))
+                    except OSError:
+                        continue  # Vanished or unreadable entry
+                    if len(batch) >= self.batch_size:
+                        entries.extend(batch)
+                        self.batch_ready.emit(batch)
+                        batch = []
+            if batch:
+                entries.extend(batch)
+                self.batch_ready.emit(batch)
+            self.listed.emit(self.folder, folder_mtime, entries)
+        except Exception as e:
+            self.failed.emit(str(e))
+
+
+class ThumbnailLoader(CancellableWorker):
+    """Produce thumbnails for capture folders on a small thread pool.
+
+    Folders are resolved through the sample index (a separate connection to
+    the same database) and thumbnails come from the on-disk cache when the
+    source file is unchanged. Once all folders are done the cache is
+    trimmed to THUMBNAIL_CACHE_MAX_BYTES, keeping the thumbnails just shown.
+    Cancelling drops the folders not started yet.
+    """
+    thumbnail_ready = QtCore.pyqtSignal(str, str)  # folder, thumbnail path
+
+    def __init__(self, folders, cache_dir, index_path, max_workers=4, parent=None):
+        super().__init__(parent)
+        self.folders = list(folders)
+        self.cache_dir = cache_dir
+        self.index_path = index_path
+        self.max_workers = max_workers
+
+    def run(self):
+        index = SampleIndex(self.index_path)
+        try:
+            with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+                futures = {}
+                shown = []
+                for folder in self.folders:
+                    if self._cancelled:
+                        break
+                    try:
+                        source = thumbnail_source(index.get(folder))
+                    except Exception:
+                        continue  # Unreadable folder; keep the generic icon
+                    if source is not None:
+                        futures[pool.submit(cached_thumbnail, source, self.cache_dir)] = folder
+                for future in as_completed(futures):
+                    if self._cancelled:
+                        for pending in futures:
+                            pending.cancel()
+                        return
+                    try:
+                        path = future.result()
+                    except Exception:
+                        continue
+                    if path is not None:
+                        shown.append(path)
+                        self.thumbnail_ready.emit(futures[future], path)
+            prune_cache_dir(self.cache_dir, THUMBNAIL_CACHE_MAX_BYTES, keep=shown, suffix=".png")
+        finally:
+            index.close()
+
+
+class DisplayCubeBuilder(CancellableWorker):
+    """Quantize a cube into uint8 display frames once its statistics are known."""
+    progress = QtCore.pyqtSignal(int)
+    ready = QtCore.pyqtSignal(object)  # (bands, cols, rows) uint8 memmap
+    failed = QtCore.pyqtSignal(str)
+
+    def __init__(self, data, stats, stretch, path, parent=None):
+        super().__init__(parent)
+        self.data = data
+        self.stats = stats
+        self.stretch = stretch
+        self.path = path
+
+    def run(self):
+        try:
+            rows, cols, bands = self.data.shape
+            # Reuse frames written earlier in this session with the same stretch
+            if os.path.exists(self.path):
+                cached = np.load(self.path, mmap_mode='r')
+                if cached.shape == (bands, cols, rows):
+                    touch_cache_file(self.path)
+                    self.ready.emit(cached)
+                    return
+                del cached
+
+            cube = write_display_cube(
+                self.data, self.stats, self.stretch, self.path,
+                progress=lambda fraction: self.progress.emit(int(fraction * 100)),
+                cancelled=self.is_cancelled,
+            )
+            if cube is not None:
+                self.ready.emit(cube)
+        except Exception as e:
+            self.failed.emit(str(e))